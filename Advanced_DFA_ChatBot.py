@@ -2,271 +2,2671 @@ import json
 import random
 import time
 import os
+import sys
+import io
+import gzip
+import zlib
+import mmap
+import struct
+import hashlib
+import math
+import heapq
+import bisect
+import contextlib
+import threading
 from datetime import datetime
-from collections import defaultdict
+from collections import defaultdict, deque, Counter, OrderedDict
+from collections.abc import Sequence, Mapping, MutableMapping
+from array import array
+from itertools import islice, chain, groupby
 import re
 from difflib import SequenceMatcher
 
-class AdvancedDFAChatbot:
+try:
+    import zstandard
+except ImportError:   # optional: zstd exports fall back to gzip
+    zstandard = None
+
+def is_accept_state(state, accept):
+    """accept is one state name, or a list of them for DFAs compiled from regex patterns"""
+    return state in accept if isinstance(accept, list) else state == accept
+
+class DFABuilder:
+    """Mutable union automaton used while pattern DFAs are being merged"""
+    
     def __init__(self):
-        self.dfas = {
-            "hi": {
-                "dfa": {
-                    "q0": {'h': 'q1'},
-                    "q1": {'i': 'q2'},
-                    "q2": {}
-                },
-                "accept": "q2",
-                "responses": [
-                    "Hello! 👋 Great to see you!",
-                    "Hi there! How can I help you today?",
-                    "Hey! Welcome to our DFA-powered chat!"
-                ],
-                "category": "greeting",
-                "priority": 1
-            },
-            "hello": {
-                "dfa": {
-                    "q0": {'h': 'q1'},
-                    "q1": {'e': 'q2'},
-                    "q2": {'l': 'q3'},
-                    "q3": {'l': 'q4'},
-                    "q4": {'o': 'q5'},
-                    "q5": {}
-                },
-                "accept": "q5",
-                "responses": [
-                    "Hello! 🌟 Nice to meet you!",
-                    "Greetings! How are you doing today?",
-                    "Hello there! Ready to chat?"
-                ],
-                "category": "greeting",
-                "priority": 1
-            },
-            "how are you": {
-                "dfa": {
-                    "q0": {'h': 'q1'},
-                    "q1": {'o': 'q2'},
-                    "q2": {'w': 'q3'},
-                    "q3": {' ': 'q4'},
-                    "q4": {'a': 'q5'},
-                    "q5": {'r': 'q6'},
-                    "q6": {'e': 'q7'},
-                    "q7": {' ': 'q8'},
-                    "q8": {'y': 'q9'},
-                    "q9": {'o': 'q10'},
-                    "q10": {'u': 'q11'},
-                    "q11": {}
-                },
-                "accept": "q11",
-                "responses": [
-                    "I'm functioning perfectly! 🚀 Thanks for asking!",
-                    "Doing great! My DFA states are all working smoothly! ⚡",
-                    "Excellent! Ready to process your inputs efficiently! 💫",
-                    "I'm doing well! How about you?"
-                ],
-                "category": "status",
-                "priority": 2
-            },
-            "what is your name": {
-                "dfa": {
-                    "q0": {'w': 'q1'},
-                    "q1": {'h': 'q2'},
-                    "q2": {'a': 'q3'},
-                    "q3": {'t': 'q4'},
-                    "q4": {' ': 'q5'},
-                    "q5": {'i': 'q6'},
-                    "q6": {'s': 'q7'},
-                    "q7": {' ': 'q8'},
-                    "q8": {'y': 'q9'},
-                    "q9": {'o': 'q10'},
-                    "q10": {'u': 'q11'},
-                    "q11": {'r': 'q12'},
-                    "q12": {' ': 'q13'},
-                    "q13": {'n': 'q14'},
-                    "q14": {'a': 'q15'},
-                    "q15": {'m': 'q16'},
-                    "q16": {'e': 'q17'},
-                    "q17": {}
-                },
-                "accept": "q17",
-                "responses": [
-                    "I'm DFA-Bot! 🤖 A chatbot powered by Deterministic Finite Automata!",
-                    "You can call me AutomataBot! I speak the language of state machines! ⚙️",
-                    "I'm your friendly DFA assistant!"
-                ],
-                "category": "identity",
-                "priority": 2
-            },
-            "good bye": {
-                "dfa": {
-                    "q0": {'g': 'q1'},
-                    "q1": {'o': 'q2'},
-                    "q2": {'o': 'q3'},
-                    "q3": {'d': 'q4'},
-                    "q4": {' ': 'q5'},
-                    "q5": {'b': 'q6'},
-                    "q6": {'y': 'q7'},
-                    "q7": {'e': 'q8'},
-                    "q8": {}
-                },
-                "accept": "q8",
-                "responses": [
-                    "Goodbye! 👋 Have an amazing day ahead!",
-                    "See you later! Thanks for chatting with me! 🌟",
-                    "Farewell! Hope to see you again soon! ✨"
-                ],
-                "category": "farewell",
-                "priority": 1
-            },
-            "tell me a joke": {
-                "dfa": {
-                    "q0": {'t': 'q1'},
-                    "q1": {'e': 'q2'},
-                    "q2": {'l': 'q3'},
-                    "q3": {'l': 'q4'},
-                    "q4": {' ': 'q5'},
-                    "q5": {'m': 'q6'},
-                    "q6": {'e': 'q7'},
-                    "q7": {' ': 'q8'},
-                    "q8": {'a': 'q9'},
-                    "q9": {' ': 'q10'},
-                    "q10": {'j': 'q11'},
-                    "q11": {'o': 'q12'},
-                    "q12": {'k': 'q13'},
-                    "q13": {'e': 'q14'},
-                    "q14": {}
-                },
-                "accept": "q14",
-                "responses": [
-                    "Why do programmers prefer dark mode? Because light attracts bugs! 🐛💡",
-                    "What do you call a DFA that tells jokes? A Finite State Machine with infinite humor! 😄",
-                    "Why did the automaton go to therapy? It had too many state transitions! 🤖💭",
-                    "How do you comfort a JavaScript bug? You console it! 😂"
-                ],
-                "category": "entertainment",
-                "priority": 3
-            },
-            "what can you do": {
-                "dfa": {
-                    "q0": {'w': 'q1'},
-                    "q1": {'h': 'q2'},
-                    "q2": {'a': 'q3'},
-                    "q3": {'t': 'q4'},
-                    "q4": {' ': 'q5'},
-                    "q5": {'c': 'q6'},
-                    "q6": {'a': 'q7'},
-                    "q7": {'n': 'q8'},
-                    "q8": {' ': 'q9'},
-                    "q9": {'y': 'q10'},
-                    "q10": {'o': 'q11'},
-                    "q11": {'u': 'q12'},
-                    "q12": {' ': 'q13'},
-                    "q13": {'d': 'q14'},
-                    "q14": {'o': 'q15'},
-                    "q15": {}
-                },
-                "accept": "q15",
-                "responses": [
-                    "I can understand patterns using DFA! 🎯 I respond to greetings, questions, and more!",
-                    "I process text through finite state machines! Try different phrases and watch my DFA traces! ⚡",
-                    "I can chat, tell jokes, answer questions, and learn new patterns!"
-                ],
-                "category": "capability",
-                "priority": 2
-            },
-            "good morning": {
-                "dfa": {
-                    "q0": {'g': 'q1'},
-                    "q1": {'o': 'q2'},
-                    "q2": {'o': 'q3'},
-                    "q3": {'d': 'q4'},
-                    "q4": {' ': 'q5'},
-                    "q5": {'m': 'q6'},
-                    "q6": {'o': 'q7'},
-                    "q7": {'r': 'q8'},
-                    "q8": {'n': 'q9'},
-                    "q9": {'i': 'q10'},
-                    "q10": {'n': 'q11'},
-                    "q11": {'g': 'q12'},
-                    "q12": {}
-                },
-                "accept": "q12",
-                "responses": [
-                    "Good morning to you too! ☀️",
-                    "Morning! Hope you have a wonderful day! 🌅",
-                    "Good morning! Ready to start the day with some DFA magic? ✨"
-                ],
-                "category": "greeting",
-                "priority": 1
-            },
-            "thank you": {
-                "dfa": {
-                    "q0": {'t': 'q1'},
-                    "q1": {'h': 'q2'},
-                    "q2": {'a': 'q3'},
-                    "q3": {'n': 'q4'},
-                    "q4": {'k': 'q5'},
-                    "q5": {' ': 'q6'},
-                    "q6": {'y': 'q7'},
-                    "q7": {'o': 'q8'},
-                    "q8": {'u': 'q9'},
-                    "q9": {}
-                },
-                "accept": "q9",
-                "responses": [
-                    "You're welcome! 😊",
-                    "My pleasure! Happy to help! 🤗",
-                    "Anytime! That's what I'm here for! 💫"
-                ],
-                "category": "politeness",
-                "priority": 2
-            }
+        self.transitions = [{}]   # state id -> {char: next state id}, state 0 is the start
+        self.accept = {}          # state id -> pattern key
+        self.is_tree = True       # True while every state has a single incoming transition
+    
+    def add_entry(self, pattern, data):
+        """Merge a pattern entry, using its authoring DFA when one is stored"""
+        if "dfa" in data:
+            self.add_dfa(pattern, data["dfa"], data["accept"])
+        else:
+            self.add_literal(pattern)
+    
+    def add_literal(self, pattern):
+        """Merge the linear chain DFA that accepts exactly the pattern text"""
+        if not self.is_tree:
+            chain = {f"q{i}": {ch: f"q{i + 1}"} for i, ch in enumerate(pattern)}
+            chain[f"q{len(pattern)}"] = {}
+            self._merge_product(pattern, chain, f"q{len(pattern)}")
+            return
+        
+        transitions = self.transitions
+        state = 0
+        for ch in pattern:
+            next_state = transitions[state].get(ch)
+            if next_state is None:
+                next_state = len(transitions)
+                transitions.append({})
+                transitions[state][ch] = next_state
+            state = next_state
+        # Earlier patterns keep priority, same as iterating self.dfas in order
+        self.accept.setdefault(state, pattern)
+    
+    def add_dfa(self, pattern, dfa_dict, accept_state):
+        """Merge a general pattern DFA given in the nested dict format"""
+        if self.is_tree and self._is_tree_dfa(dfa_dict):
+            self._insert_tree(pattern, dfa_dict, accept_state)
+        else:
+            self._merge_product(pattern, dfa_dict, accept_state)
+    
+    def copy(self):
+        """Independent builder with the same states, for copy-on-write updates"""
+        builder = DFABuilder()
+        builder.transitions = [dict(row) for row in self.transitions]
+        builder.accept = dict(self.accept)
+        builder.is_tree = self.is_tree
+        return builder
+    
+    def completions(self, state=0):
+        """Pattern keys accepted from state onward, depth first in character order"""
+        transitions, accept = self.transitions, self.accept
+        seen = {state}
+        stack = [state]
+        while stack:
+            state = stack.pop()
+            if state in accept:
+                yield accept[state]
+            for _, child in sorted(transitions[state].items(), reverse=True):
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+    
+    def match(self, input_str):
+        """Walk the dict transitions and return the accepted pattern key"""
+        transitions = self.transitions
+        state = 0
+        for ch in input_str:
+            state = transitions[state].get(ch)
+            if state is None:
+                return None
+        return self.accept.get(state)
+    
+    def compile(self, minimize=False):
+        """Freeze the builder into flat integer transition tables, optionally minimized first"""
+        if not minimize:
+            return CompiledDFA(self.transitions, self.accept)
+        if self.is_tree:
+            transitions, accept, counts = self._minimize_acyclic()
+            return CompiledDFA(transitions, accept, (self._ranked_labels(), counts))
+        transitions, accept = self._minimize_partition()
+        return CompiledDFA(transitions, accept)
+    
+    def _minimize_acyclic(self):
+        """Merge trie states with equal right languages; also returns accepted-word counts"""
+        # Acceptance is boolean here: with one label per pattern no two trie states
+        # would ever be equivalent, so labels are recovered by word rank instead
+        transitions, accept = self.transitions, self.accept
+        register = {}
+        merged = [0] * len(transitions)
+        counts = [0] * len(transitions)
+        # Trie states are created after their parent, so descending ids visit children first
+        for state in range(len(transitions) - 1, -1, -1):
+            row = transitions[state]
+            accepting = state in accept
+            if len(row) == 1:
+                (ch, child), = row.items()
+                edges = ((ch, merged[child]),)
+                counts[state] = accepting + counts[child]
+            else:
+                edges = tuple(sorted((ch, merged[child]) for ch, child in row.items()))
+                counts[state] = accepting + sum(counts[child] for child in row.values())
+            merged[state] = register.setdefault((accepting, edges), state)
+        new_transitions, new_accept, order = self._renumber(merged, lambda state: state in accept)
+        return new_transitions, new_accept, [counts[state] for state in order]
+    
+    def _minimize_partition(self):
+        """Moore partition refinement for general automata, keeping accept labels distinct"""
+        transitions, accept = self.transitions, self.accept
+        label_ids = {}
+        blocks = [label_ids.setdefault(accept.get(state), len(label_ids)) for state in range(len(transitions))]
+        block_count = len(label_ids)
+        while True:
+            signatures = {}
+            refined = [signatures.setdefault(
+                           (blocks[state],
+                            tuple(sorted((ch, blocks[child]) for ch, child in row.items()))),
+                           len(signatures))
+                       for state, row in enumerate(transitions)]
+            blocks = refined
+            if len(signatures) == block_count:
+                break
+            block_count = len(signatures)
+        
+        representative = {}
+        for state, block in enumerate(blocks):
+            representative.setdefault(block, state)
+        merged = [representative[block] for block in blocks]
+        return self._renumber(merged, accept.get)[:2]
+    
+    def _renumber(self, merged, accept_of):
+        """Transition list over merged representatives, start state first; also returns their old ids"""
+        # Representatives keep their relative order, so state 0 (its own representative) stays first
+        transitions = self.transitions
+        new_ids = [-1] * len(transitions)
+        order = []
+        for state, representative in enumerate(merged):
+            if representative == state:
+                new_ids[state] = len(order)
+                order.append(state)
+        new_transitions = [{ch: new_ids[merged[child]] for ch, child in transitions[state].items()}
+                           for state in order]
+        new_accept = {}
+        for new_id, state in enumerate(order):
+            label = accept_of(state)
+            if label:
+                new_accept[new_id] = label
+        return new_transitions, new_accept, order
+    
+    def _ranked_labels(self):
+        """Pattern keys in word-rank order (accepting state before children, children by char)"""
+        transitions, accept = self.transitions, self.accept
+        labels = []
+        stack = [0]
+        while stack:
+            state = stack.pop()
+            if state in accept:
+                labels.append(accept[state])
+            row = transitions[state]
+            if len(row) == 1:
+                stack.extend(row.values())
+            elif row:
+                stack.extend(child for _, child in sorted(row.items(), reverse=True))
+        return labels
+    
+    @staticmethod
+    def _is_tree_dfa(dfa_dict):
+        """Check that no state of a pattern DFA is entered by more than one transition"""
+        seen = {"q0"}
+        for transitions in dfa_dict.values():
+            for next_state in transitions.values():
+                if next_state in seen:
+                    return False
+                seen.add(next_state)
+        return True
+    
+    def _insert_tree(self, pattern, dfa_dict, accept_state):
+        """Trie-style in-place insertion; only valid while both automata are trees"""
+        transitions = self.transitions
+        stack = [("q0", 0)]
+        while stack:
+            state, union_state = stack.pop()
+            if is_accept_state(state, accept_state):
+                self.accept.setdefault(union_state, pattern)
+            for ch, next_state in dfa_dict.get(state, {}).items():
+                next_union = transitions[union_state].get(ch)
+                if next_union is None:
+                    next_union = len(transitions)
+                    transitions.append({})
+                    transitions[union_state][ch] = next_union
+                stack.append((next_state, next_union))
+    
+    def _merge_product(self, pattern, dfa_dict, accept_state):
+        """Product construction of the current union with a general pattern DFA"""
+        old_transitions, old_accept = self.transitions, self.accept
+        transitions, accept = [{}], {}
+        ids = {(0, "q0"): 0}
+        queue = deque([(0, "q0")])
+        
+        while queue:
+            pair = queue.popleft()
+            union_state, state = pair
+            state_id = ids[pair]
+            
+            if union_state is not None and union_state in old_accept:
+                accept[state_id] = old_accept[union_state]
+            elif state is not None and is_accept_state(state, accept_state):
+                accept[state_id] = pattern
+            
+            row_union = old_transitions[union_state] if union_state is not None else {}
+            row_pattern = dfa_dict.get(state, {}) if state is not None else {}
+            for ch in list(row_union) + [c for c in row_pattern if c not in row_union]:
+                next_pair = (row_union.get(ch), row_pattern.get(ch))
+                next_id = ids.get(next_pair)
+                if next_id is None:
+                    next_id = len(transitions)
+                    ids[next_pair] = next_id
+                    transitions.append({})
+                    queue.append(next_pair)
+                transitions[state_id][ch] = next_id
+        
+        self.transitions, self.accept = transitions, accept
+        self.is_tree = False
+
+class CompiledDFA:
+    """Read-only DFA stored as row-displaced integer arrays (base/check/next)"""
+    
+    __slots__ = ('classes', 'base', 'check', 'next', 'accept', 'labels', 'weights', 'counts')
+    
+    def __init__(self, transitions, accept_map, ranked=None):
+        # Intern the alphabet: every character gets a small class id, 0 means "unknown".
+        # Ids follow character order so that rank weights agree with _ranked_labels().
+        alphabet = sorted({ch for row in transitions for ch in row})
+        classes = {ch: i + 1 for i, ch in enumerate(alphabet)}
+        
+        base = array('i', bytes(4 * len(transitions)))
+        check = array('i')
+        next_table = array('i')
+        first_free = 0
+        last_offset = {}   # column set -> offset its previous row landed on
+        
+        for state, row in enumerate(transitions):
+            if not row:
+                continue
+            columns = sorted((classes[ch], target) for ch, target in row.items())
+            # First-fit: slide the row until every column lands on a free slot.
+            # Offsets may go negative; base + class then indexes the -1 padding
+            # at the end of check, which rejects like any foreign slot.
+            offset = first_free - columns[0][0]
+            if len(columns) > 1:
+                # Slots are never freed, so offsets that failed a row with the same
+                # columns still fail and the search resumes where that row landed
+                shape = tuple(col for col, _ in columns)
+                offset = max(offset, last_offset.get(shape, offset - 1) + 1)
+                while any(offset + col < len(check) and check[offset + col] != -1
+                          for col in shape):
+                    offset += 1
+                last_offset[shape] = offset
+            needed = offset + columns[-1][0] + 1 - len(check)
+            if needed > 0:
+                check.extend([-1] * needed)
+                next_table.extend([0] * needed)
+            for col, target in columns:
+                check[offset + col] = state
+                next_table[offset + col] = target
+            base[state] = offset
+            while first_free < len(check) and check[first_free] != -1:
+                first_free += 1
+        
+        # Pad so base + class id never runs past the end of the tables
+        check.extend([-1] * (len(classes) + 1))
+        next_table.extend([0] * (len(classes) + 1))
+        
+        accept = array('i', [-1]) * len(transitions)
+        weights = None
+        counts = None
+        if ranked is not None:
+            # Minimal acyclic automaton shared by many patterns: the label of an accepted
+            # word is its rank, i.e. the sum of the transition weights along its path
+            labels, counts = ranked
+            for state in accept_map:
+                accept[state] = 0
+            weights = self._rank_weights(transitions, accept_map, counts, classes, base, len(next_table))
+            counts = array('I', counts)
+        else:
+            labels = []
+            label_ids = {}
+            for state, pattern in accept_map.items():
+                if pattern not in label_ids:
+                    label_ids[pattern] = len(labels)
+                    labels.append(pattern)
+                accept[state] = label_ids[pattern]
+        
+        self.classes = classes
+        self.base = base
+        self.check = check
+        self.next = next_table
+        self.accept = accept
+        self.labels = labels
+        self.weights = weights
+        self.counts = counts   # ranked only: words accepted at or below each state
+    
+    @staticmethod
+    def _rank_weights(transitions, accept_map, counts, classes, base, size):
+        """Per-slot rank increments: words accepted before taking this transition"""
+        weights = array('i', bytes(4 * size))
+        for state, row in enumerate(transitions):
+            before = 1 if state in accept_map else 0
+            if len(row) == 1:
+                (ch, child), = row.items()
+                weights[base[state] + classes[ch]] = before
+                continue
+            for ch, child in sorted(row.items()):
+                weights[base[state] + classes[ch]] = before
+                before += counts[child]
+        return weights
+    
+    @classmethod
+    def from_tables(cls, classes, base, check, next_table, accept, labels, weights=None, counts=None):
+        """Wrap existing tables (e.g. memoryviews over a PatternStore) without copying"""
+        compiled = cls.__new__(cls)
+        compiled.classes = classes
+        compiled.base = base
+        compiled.check = check
+        compiled.next = next_table
+        compiled.accept = accept
+        compiled.labels = labels
+        compiled.weights = weights
+        compiled.counts = counts
+        return compiled
+    
+    @property
+    def state_count(self):
+        return len(self.base)
+    
+    def run(self, input_str, state=0):
+        """Advance from a state over the input; returns the final state id or -1 on reject"""
+        classes, base, check, next_table = self.classes, self.base, self.check, self.next
+        for ch in input_str:
+            slot = base[state] + classes.get(ch, 0)
+            if check[slot] != state:
+                return -1
+            state = next_table[slot]
+        return state
+    
+    def match(self, input_str):
+        """Return the pattern key accepted by the compiled automaton, if any"""
+        if self.weights is not None:
+            return self._match_ranked(input_str)
+        state = self.run(input_str)
+        if state < 0 or self.accept[state] < 0:
+            return None
+        return self.labels[self.accept[state]]
+    
+    def _match_ranked(self, input_str):
+        """Like run(), but also sums rank weights to recover the pattern label"""
+        classes, base, check, next_table, weights = self.classes, self.base, self.check, self.next, self.weights
+        state = 0
+        rank = 0
+        for ch in input_str:
+            slot = base[state] + classes.get(ch, 0)
+            if check[slot] != state:
+                return None
+            rank += weights[slot]
+            state = next_table[slot]
+        if self.accept[state] < 0:
+            return None
+        return self.labels[rank]
+    
+    def label_at(self, state, rank=0):
+        """Pattern key accepted exactly at state (reached with the given rank sum), or None"""
+        if state < 0 or self.accept[state] < 0:
+            return None
+        return self.labels[rank if self.weights is not None else self.accept[state]]
+    
+    def completions(self, state, rank=0):
+        """Pattern keys accepted from state onward, in character order"""
+        if self.counts is not None:
+            # Words below a state of a ranked automaton form one contiguous rank range
+            labels = self.labels
+            for i in range(rank, rank + self.counts[state]):
+                yield labels[i]
+            return
+        base, check, next_table, accept, labels = self.base, self.check, self.next, self.accept, self.labels
+        class_count = len(self.classes)
+        seen = {state}
+        emitted = set()
+        stack = [state]
+        while stack:
+            state = stack.pop()
+            if accept[state] >= 0 and accept[state] not in emitted:
+                emitted.add(accept[state])
+                yield labels[accept[state]]
+            # Class ids follow character order, so pushing them in reverse visits "a" first
+            offset = base[state]
+            for class_id in range(class_count, 0, -1):
+                if check[offset + class_id] == state:
+                    child = next_table[offset + class_id]
+                    if child not in seen:
+                        seen.add(child)
+                        stack.append(child)
+
+class UnionDFA:
+    """Compiled union of all pattern DFAs plus a small incrementally built overlay"""
+    
+    overlay_limit = 256   # overlay size that starts a background fold into a new base
+    overlay_cap = 1024    # learning waits for that fold past this size
+    
+    def __init__(self, minimize=True):
+        self.compiled = DFABuilder().compile()
+        self.general = None               # cyclic or shared-state DFAs (regex patterns), if any
+        self.regex_wins = frozenset()     # (literal, regex) pairs where the earlier-listed regex wins
+        self.regex_patterns = frozenset() # keys of "syntax": "regex" entries, which are not phrases
+        self.overlay = DFABuilder()
+        self.overlay_size = 0
+        self.minimize = minimize
+        self.states_before = 1   # union size before minimization
+    
+    @property
+    def states_after(self):
+        return self.compiled.state_count + (self.general.state_count if self.general is not None else 0)
+    
+    @property
+    def overlay_states(self):
+        """States of the learned overlay, which are not in the compiled figures until the next fold"""
+        return len(self.overlay.transitions) if self.overlay_size else 0
+    
+    def build(self, dfas):
+        """Compile the whole pattern dictionary in one pass"""
+        # A product merge costs O(union size) and turns every later trie insert into one too,
+        # so general DFAs are merged among themselves only, away from the literal trie
+        builder, general = DFABuilder(), DFABuilder()
+        regexes = 0
+        regex_patterns = set()
+        for pattern, data in dfas.items():
+            if data.get("syntax") == "regex":
+                regex_patterns.add(pattern)
+            if "dfa" in data and not DFABuilder._is_tree_dfa(data["dfa"]):
+                # Merged in dict order, so an earlier regex keeps its accept states
+                general._merge_product(pattern, data["dfa"], data["accept"])
+                regexes += 1
+            else:
+                builder.add_entry(pattern, data)
+        self.regex_patterns = frozenset(regex_patterns)
+        self.compiled = builder.compile(minimize=self.minimize)
+        self.states_before = len(builder.transitions)
+        self.general = None
+        self.regex_wins = frozenset()
+        if regexes:
+            self.general = general.compile(minimize=self.minimize)
+            self.states_before += len(general.transitions)
+            self.regex_wins = self._regex_wins(dfas, builder)
+        self.overlay = DFABuilder()
+        self.overlay_size = 0
+    
+    def _regex_wins(self, dfas, builder):
+        """Pairs of a literal and a regex accepting the same word where the regex is listed first"""
+        # Walk the literal trie alongside the regex automaton; most branches reject within a few characters
+        transitions, accept = builder.transitions, builder.accept
+        general = self.general
+        classes, base, check, next_table = general.classes, general.base, general.check, general.next
+        collisions = set()
+        stack = [(0, 0)]
+        while stack:
+            state, regex_state = stack.pop()
+            if state in accept:
+                regex = general.label_at(regex_state)
+                if regex is not None:
+                    collisions.add((accept[state], regex))
+            for ch, child in transitions[state].items():
+                slot = base[regex_state] + classes.get(ch, 0)
+                if check[slot] == regex_state:
+                    stack.append((child, next_table[slot]))
+        if not collisions:
+            return frozenset()
+        named = {pattern for pair in collisions for pattern in pair}
+        positions = {pattern: i for i, pattern in enumerate(dfas) if pattern in named}
+        return frozenset(pair for pair in collisions if positions[pair[1]] < positions[pair[0]])
+    
+    def load_compiled(self, compiled, states_before=None, general=None, regex_wins=frozenset(),
+                      regex_patterns=frozenset()):
+        """Adopt tables that were compiled ahead of time for a pattern dictionary"""
+        self.compiled = compiled
+        self.general = general
+        self.regex_wins = regex_wins
+        self.regex_patterns = regex_patterns
+        self.states_before = states_before or self.states_after
+        self.overlay = DFABuilder()
+        self.overlay_size = 0
+    
+    def with_pattern(self, pattern, data):
+        """Copy extended by one learned pattern; the compiled tables are shared, not copied"""
+        union = UnionDFA(self.minimize)
+        union.compiled = self.compiled
+        union.general = self.general
+        union.regex_wins = self.regex_wins
+        union.regex_patterns = self.regex_patterns
+        union.states_before = self.states_before
+        union.overlay = self.overlay.copy()
+        union.overlay.add_entry(pattern, data)
+        union.overlay_size = self.overlay_size + 1
+        return union
+    
+    def regex_match(self, input_str):
+        """Regex pattern accepting the input, or None; it answers before any learned literal would"""
+        return self.general.match(input_str) if self.general is not None else None
+    
+    def choose(self, literal, regex):
+        """Resolve a match found by both the literal tables and the regex automaton"""
+        if regex is not None and (literal is None or (literal, regex) in self.regex_wins):
+            return regex
+        return literal
+    
+    def match(self, input_str):
+        """Single pass over the compiled tables and any regex automaton, then over the (small) overlay"""
+        pattern = self.compiled.match(input_str)
+        if self.general is not None:
+            pattern = self.choose(pattern, self.general.match(input_str))
+        if pattern is None and self.overlay_size:
+            pattern = self.overlay.match(input_str)
+        return pattern
+
+class RegexCompiler:
+    """Small regex syntax compiled through a Thompson NFA and subset construction to a pattern DFA"""
+    
+    # Classes, optional parts, alternation, repetition and \s/\d/\w; the match is always anchored
+    SPECIAL = set('()[]{}|?*+\\.')
+    ESCAPES = {'s': ' \t\n\r\f\v', 'd': '0123456789', 'w': 'abcdefghijklmnopqrstuvwxyz0123456789_',
+               't': '\t', 'n': '\n'}
+    REPEAT_LIMIT = 32
+    MAX_STATES = 4096
+    
+    def __init__(self, source):
+        self.source = source
+        self.pos = 0
+        self.edges = []   # NFA state -> [(frozenset of chars or None for epsilon, target)]
+    
+    def compile(self):
+        """(dfa dict, accept state or list of accept states) in the format run_dfa_with_trace executes"""
+        source = self.source
+        # Patterns always match the whole input, so explicit anchors are accepted and dropped
+        if source.startswith('^'):
+            self.pos = 1
+        if source.endswith('$') and not source.endswith('\\$'):
+            source = self.source = source[:-1]
+        node = self._alternation()
+        if self.pos < len(source):
+            raise self._error("unbalanced ')'")
+        start, end = self._fragment(node)
+        transitions, accepting = self._determinize(start, end)
+        if accepting[0]:
+            raise ValueError(f"regex '{self.source}' matches the empty string")
+        
+        # Moore minimization, reusing the union builder's partition refinement
+        builder = DFABuilder()
+        builder.transitions = transitions
+        builder.accept = {state: True for state, accepts in enumerate(accepting) if accepts}
+        builder.is_tree = False
+        transitions, accept = builder._minimize_partition()
+        dfa = {f"q{state}": {ch: f"q{target}" for ch, target in sorted(row.items())}
+               for state, row in enumerate(transitions)}
+        accept_states = [f"q{state}" for state in sorted(accept)]
+        return dfa, accept_states[0] if len(accept_states) == 1 else accept_states
+    
+    def _error(self, message):
+        return ValueError(f"regex '{self.source}' at {self.pos}: {message}")
+    
+    def _peek(self):
+        return self.source[self.pos] if self.pos < len(self.source) else None
+    
+    # Parser: alternation > concatenation > repetition > atom, producing a small tuple AST
+    
+    def _alternation(self):
+        branches = [self._concatenation()]
+        while self._peek() == '|':
+            self.pos += 1
+            branches.append(self._concatenation())
+        return branches[0] if len(branches) == 1 else ('alt', branches)
+    
+    def _concatenation(self):
+        items = []
+        while self._peek() not in (None, '|', ')'):
+            items.append(self._repetition())
+        if not items:
+            return ('empty',)
+        return items[0] if len(items) == 1 else ('cat', items)
+    
+    def _repetition(self):
+        node = self._atom()
+        while self._peek() in ('?', '*', '+', '{'):
+            op = self.source[self.pos]
+            self.pos += 1
+            if op == '?':
+                node = ('opt', node)
+            elif op == '*':
+                node = ('star', node)
+            elif op == '+':
+                node = ('cat', [node, ('star', node)])
+            else:
+                node = self._counted(node)
+        return node
+    
+    def _counted(self, node):
+        """Expand {m}, {m,} and {m,n} into concatenations of the repeated node"""
+        close = self.source.find('}', self.pos)
+        if close < 0:
+            raise self._error("unterminated '{'")
+        low, comma, high = self.source[self.pos:close].partition(',')
+        try:
+            low = int(low)
+            high = int(high) if high else (None if comma else low)
+        except ValueError:
+            raise self._error("expected {m}, {m,} or {m,n}") from None
+        if high is not None and (high < low or high > self.REPEAT_LIMIT) or low > self.REPEAT_LIMIT:
+            raise self._error(f"repeat counts must be ordered and at most {self.REPEAT_LIMIT}")
+        self.pos = close + 1
+        items = [node] * low
+        if high is None:
+            items.append(('star', node))
+        else:
+            items.extend([('opt', node)] * (high - low))
+        return ('cat', items) if items else ('empty',)
+    
+    def _atom(self):
+        ch = self._peek()
+        self.pos += 1
+        if ch == '(':
+            if self.source.startswith('?:', self.pos):
+                self.pos += 2
+            node = self._alternation()
+            if self._peek() != ')':
+                raise self._error("missing ')'")
+            self.pos += 1
+            return node
+        if ch == '[':
+            return ('chars', self._char_class())
+        if ch == '\\':
+            return ('chars', self._escape())
+        if ch == '.':
+            raise self._error("'.' (any character) is not supported; use a class such as [a-z] or '\\.'")
+        if ch in self.SPECIAL:
+            raise self._error(f"unexpected '{ch}'")
+        return ('chars', self._lower(ch))
+    
+    def _escape(self):
+        if self.pos >= len(self.source):
+            raise self._error("trailing '\\'")
+        ch = self.source[self.pos]
+        self.pos += 1
+        if ch.isalnum() and ch not in self.ESCAPES:
+            raise self._error(f"unknown escape '\\{ch}'")
+        return self._lower(self.ESCAPES.get(ch, ch))
+    
+    def _char_class(self):
+        if self._peek() == '^':
+            raise self._error("negated classes are not supported")
+        chars = set()
+        while True:
+            ch = self._peek()
+            if ch is None:
+                raise self._error("unterminated '['")
+            self.pos += 1
+            if ch == ']' and chars:
+                return frozenset(chars)
+            if ch == '\\':
+                chars |= self._escape()
+                continue
+            if self._peek() == '-' and self.source[self.pos + 1:self.pos + 2] not in ('', ']'):
+                last = self.source[self.pos + 1]
+                self.pos += 2
+                if last < ch:
+                    raise self._error(f"bad range {ch}-{last}")
+                chars |= self._lower(''.join(map(chr, range(ord(ch), ord(last) + 1))))
+            else:
+                chars |= self._lower(ch)
+    
+    @staticmethod
+    def _lower(chars):
+        # Input is lowercased before matching, so patterns only need lowercase transitions
+        return frozenset(ch.lower() if len(ch.lower()) == 1 else ch for ch in chars)
+    
+    # Thompson construction: every fragment has one start and one end state
+    
+    def _state(self):
+        self.edges.append([])
+        return len(self.edges) - 1
+    
+    def _fragment(self, node):
+        kind = node[0]
+        start = self._state()
+        if kind == 'chars':
+            end = self._state()
+            self.edges[start].append((node[1], end))
+        elif kind == 'empty':
+            end = start
+        elif kind == 'cat':
+            end = start
+            for item in node[1]:
+                first, last = self._fragment(item)
+                self.edges[end].append((None, first))
+                end = last
+        elif kind == 'alt':
+            end = self._state()
+            for branch in node[1]:
+                first, last = self._fragment(branch)
+                self.edges[start].append((None, first))
+                self.edges[last].append((None, end))
+        else:   # 'opt' or 'star'
+            end = self._state()
+            first, last = self._fragment(node[1])
+            self.edges[start].append((None, first))
+            self.edges[start].append((None, end))
+            self.edges[last].append((None, end))
+            if kind == 'star':
+                self.edges[last].append((None, first))
+        return start, end
+    
+    def _closure(self, states):
+        edges = self.edges
+        closure = set(states)
+        stack = list(states)
+        while stack:
+            for label, target in edges[stack.pop()]:
+                if label is None and target not in closure:
+                    closure.add(target)
+                    stack.append(target)
+        return frozenset(closure)
+    
+    def _determinize(self, start, end):
+        """Subset construction; returns (transition list, accepting flags) with state 0 as start"""
+        edges = self.edges
+        first = self._closure([start])
+        ids = {first: 0}
+        subsets = [first]
+        transitions = []
+        for subset in subsets:
+            moves = defaultdict(set)
+            for state in subset:
+                for label, target in edges[state]:
+                    if label is not None:
+                        for ch in label:
+                            moves[ch].add(target)
+            row = {}
+            for ch, targets in moves.items():
+                target = self._closure(targets)
+                target_id = ids.get(target)
+                if target_id is None:
+                    if len(subsets) >= self.MAX_STATES:
+                        raise ValueError(f"regex '{self.source}' needs more than {self.MAX_STATES} DFA states")
+                    target_id = ids[target] = len(subsets)
+                    subsets.append(target)
+                row[ch] = target_id
+            transitions.append(row)
+        return transitions, [end in subset for subset in subsets]
+
+class RegexCache:
+    """Compiled regex pattern DFAs keyed by a hash of their source, optionally persisted as JSON"""
+    
+    VERSION = 1   # bump when RegexCompiler output changes
+    
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = None   # source hash -> {'dfa': ..., 'accept': ...}, read on first use
+        self.used = set()
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+    
+    def compile(self, source):
+        """(dfa dict, accept) for a regex source, compiling it only on a cache miss"""
+        if self.entries is None:
+            self.entries = self._read()
+        key = hashlib.sha256(f"{self.VERSION}\0{source}".encode('utf-8')).hexdigest()
+        self.used.add(key)
+        cached = self.entries.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached['dfa'], cached['accept']
+        self.misses += 1
+        dfa, accept = RegexCompiler(source).compile()
+        self.entries[key] = {'dfa': dfa, 'accept': accept}
+        self.dirty = True
+        return dfa, accept
+    
+    def save(self):
+        """Atomically write the entries used since loading, dropping ones no pattern needs any more"""
+        if not self.path or not self.dirty:
+            return
+        entries = {key: entry for key, entry in self.entries.items() if key in self.used}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+    
+    def _read(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return {}   # a damaged cache only costs recompilation
+        return entries if isinstance(entries, dict) else {}
+
+class StreamMatcher:
+    """Incremental matcher over one UnionDFA: each feed() costs O(new characters)"""
+    
+    def __init__(self, union):
+        self.union = union
+        self.reset()
+    
+    def reset(self, union=None):
+        """Start over from q0, optionally against a newer union automaton"""
+        if union is not None:
+            self.union = union
+        self.state = 0      # compiled state, -1 once rejected
+        self.rank = 0       # rank-weight sum along the path (ranked automata only)
+        self.regex_state = 0 if self.union.general is not None else -1
+        self.overlay_state = 0 if self.union.overlay_size else None
+        self.started = False   # leading whitespace is dropped, like str.strip()
+        self.pending = ""      # trailing whitespace, applied only once more text follows
+        self.fed = 0
+    
+    def feed(self, chars):
+        """Advance over newly arrived characters; returns whether a pattern can still match"""
+        self.fed += len(chars)
+        text = chars.lower()
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        body = text.rstrip()
+        if body:
+            self.state, self.rank, self.regex_state, self.overlay_state = self._walk(self.pending + body)
+            self.pending = text[len(body):]
+        else:
+            self.pending += text
+        return self.possible
+    
+    def _walk(self, text):
+        """(state, rank, regex state, overlay state) after text from the current position; nothing is committed"""
+        state, rank, regex_state, overlay_state = self.state, self.rank, self.regex_state, self.overlay_state
+        if state >= 0 and text:
+            compiled = self.union.compiled
+            classes, base, check, next_table, weights = (compiled.classes, compiled.base, compiled.check,
+                                                         compiled.next, compiled.weights)
+            for ch in text:
+                slot = base[state] + classes.get(ch, 0)
+                if check[slot] != state:
+                    state = -1
+                    break
+                if weights is not None:
+                    rank += weights[slot]
+                state = next_table[slot]
+        if regex_state >= 0 and text:
+            regex_state = self.union.general.run(text, regex_state)
+        if overlay_state is not None:
+            transitions = self.union.overlay.transitions
+            for ch in text:
+                overlay_state = transitions[overlay_state].get(ch)
+                if overlay_state is None:
+                    break
+        return state, rank, regex_state, overlay_state
+    
+    def match(self):
+        """Pattern the input so far matches exactly (as find_best_match would), or None"""
+        pattern = self.union.compiled.label_at(self.state, self.rank)
+        if self.regex_state >= 0:
+            pattern = self.union.choose(pattern, self.union.general.label_at(self.regex_state))
+        if pattern is None and self.overlay_state is not None:
+            pattern = self.union.overlay.accept.get(self.overlay_state)
+        return pattern
+    
+    @property
+    def possible(self):
+        """False once no pattern can match however the input continues (early rejection)"""
+        return self.match() is not None or next(self.continuations(), None) is not None
+    
+    def continuations(self):
+        """Patterns reachable by appending more text, compiled tables first, then regexes, then the overlay"""
+        state, rank, regex_state, overlay_state = self._walk(self.pending)
+        if state >= 0:
+            yield from self.union.compiled.completions(state, rank)
+        if regex_state >= 0:
+            yield from self.union.general.completions(regex_state)
+        if overlay_state is not None:
+            yield from self.union.overlay.completions(overlay_state)
+    
+    def reachable(self, limit=10):
+        """Up to limit type-ahead predictions: the current match first, then completions"""
+        predictions = []
+        current = self.match()
+        if current is not None:
+            predictions.append(current)
+        for pattern in self.continuations():
+            if limit is not None and len(predictions) >= limit:
+                break
+            if pattern not in predictions:
+                predictions.append(pattern)
+        return predictions
+
+class FuzzyIndex:
+    """Padded bigram inverted index with length filtering for fuzzy lookups"""
+    
+    def __init__(self):
+        self.patterns = []   # pattern id -> pattern key
+        self.postings = {}   # bigram -> {pattern length: [pattern ids]}
+        self.batch = None    # BatchFuzzyScorer frozen from these postings, built on demand
+    
+    @staticmethod
+    def grams(text):
+        """Set of bigrams of the text padded with start/end markers"""
+        padded = f"\x02{text}\x03"
+        return {padded[i:i + 2] for i in range(len(padded) - 1)}
+    
+    def build(self, dfas):
+        """Index every pattern key from scratch"""
+        self.patterns = []
+        self.postings = {}
+        for pattern in dfas:
+            self.add(pattern)
+    
+    def add(self, pattern):
+        """Incrementally index one new pattern key"""
+        self.batch = None
+        pattern_id = len(self.patterns)
+        self.patterns.append(pattern)
+        length = len(pattern)
+        for gram in self.grams(pattern):
+            self.postings.setdefault(gram, {}).setdefault(length, []).append(pattern_id)
+    
+    def search(self, query, threshold=0.75, top_k=32):
+        """Score the top_k index candidates; returns (similarity, pattern) pairs best first"""
+        return self.score(query, self.candidates(query, threshold, top_k), threshold)
+    
+    def batch_scorer(self):
+        """Vectorized scorer over this index for many queries at once"""
+        # Two threads may both build one; either result is correct
+        batch = self.batch
+        if batch is None:
+            batch = self.batch = BatchFuzzyScorer(self)
+        return batch
+    
+    def candidates(self, query, threshold=0.75, top_k=32):
+        """Ids of the top_k patterns sharing the most bigrams within the length window"""
+        # ratio = 2*M / (len(a) + len(b)) can only reach the threshold inside this length window
+        length = len(query)
+        min_length = math.ceil(threshold * length / (2 - threshold))
+        max_length = math.floor(length * (2 - threshold) / threshold)
+        
+        counts = Counter()
+        for gram in self.grams(query):
+            for pattern_length, pattern_ids in self.postings.get(gram, {}).items():
+                if min_length <= pattern_length <= max_length:
+                    counts.update(pattern_ids)
+        
+        # Most shared bigrams first; earlier patterns win ties like the old linear scan
+        return [pattern_id for pattern_id, _ in
+                heapq.nsmallest(top_k, counts.items(), key=lambda item: (-item[1], item[0]))]
+    
+    def score(self, query, candidates, threshold=0.75):
+        """Exact SequenceMatcher similarity for candidate ids; (similarity, pattern) best first"""
+        matcher = SequenceMatcher(None, query)
+        results = []
+        for pattern_id in candidates:
+            matcher.set_seq2(self.patterns[pattern_id])
+            if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+                continue
+            similarity = matcher.ratio()
+            if similarity >= threshold:
+                results.append((similarity, pattern_id))
+        
+        results.sort(key=lambda item: (-item[0], item[1]))
+        return [(similarity, self.patterns[pattern_id]) for similarity, pattern_id in results]
+
+class BatchFuzzyScorer:
+    """Fuzzy lookups for many queries at once: bigram-vector products per block, exact re-rank"""
+    
+    BLOCK_CELLS = 1 << 22   # queries x patterns shared-count cells scored per block
+    _numpy = False          # not imported yet; afterwards the module, or None when it is missing
+    
+    def __init__(self, index):
+        self.index = index
+        self.gram_ids = {}
+        # Flat postings sorted by (gram, pattern length); keys[i] = gram id * stride + length,
+        # so one searchsorted finds the length window of any gram
+        self.keys = None
+        self.ids = None
+        self.stride = 1
+        if self.numpy() is not None:
+            self.freeze()
+    
+    @classmethod
+    def numpy(cls):
+        """numpy, imported on first use because it would double the module's import time"""
+        if cls._numpy is False:
+            try:
+                import numpy
+            except ImportError:   # optional: batch fuzzy scoring falls back to FuzzyIndex lookups
+                numpy = None
+            cls._numpy = numpy
+        return cls._numpy
+    
+    def freeze(self):
+        """Copy the index's bigram postings into flat sorted arrays"""
+        np = self.numpy()
+        postings = self.index.postings
+        self.gram_ids = {gram: i for i, gram in enumerate(postings)}
+        self.stride = max(map(len, self.index.patterns), default=0) + 1
+        keys, ids = [], []
+        for gram_id, by_length in enumerate(postings.values()):
+            for length, pattern_ids in sorted(by_length.items()):
+                keys.extend([gram_id * self.stride + length] * len(pattern_ids))
+                ids.extend(pattern_ids)
+        self.keys = np.array(keys, dtype=np.int64)
+        self.ids = np.array(ids, dtype=np.int64)
+    
+    def best_matches(self, queries, threshold=0.75, top_k=32):
+        """Best (similarity, pattern) per query, or None; same answers as FuzzyIndex.search"""
+        if self.numpy() is None or not self.index.patterns:
+            return [next(iter(self.index.search(query, threshold, top_k)), None) for query in queries]
+        block = max(1, self.BLOCK_CELLS // len(self.index.patterns))
+        results = []
+        for start in range(0, len(queries), block):
+            chunk = queries[start:start + block]
+            for query, candidates in zip(chunk, self.candidates(chunk, threshold, top_k)):
+                scored = self.index.score(query, candidates, threshold)
+                results.append(scored[0] if scored else None)
+        return results
+    
+    def candidates(self, queries, threshold, top_k):
+        """Top_k candidate ids per query, ranked like FuzzyIndex.candidates"""
+        np = self.numpy()
+        pattern_count = len(self.index.patterns)
+        rows, grams = [], []
+        for row, query in enumerate(queries):
+            for gram in FuzzyIndex.grams(query):
+                gram_id = self.gram_ids.get(gram)
+                if gram_id is not None:
+                    rows.append(row)
+                    grams.append(gram_id)
+        if not rows:
+            return [[] for _ in queries]
+        
+        # Same length window as the online path: outside it the ratio can't reach the threshold
+        min_length = np.array([math.ceil(threshold * len(query) / (2 - threshold)) for query in queries])
+        max_length = np.array([min(self.stride - 1, math.floor(len(query) * (2 - threshold) / threshold))
+                               for query in queries])
+        
+        # Sparse product of the query and pattern bigram incidence matrices: every
+        # (query, gram) pair adds one to each pattern of that gram inside the length window
+        rows = np.array(rows, dtype=np.int64)
+        grams = np.array(grams, dtype=np.int64) * self.stride
+        starts = np.searchsorted(self.keys, grams + min_length[rows])
+        sizes = np.maximum(np.searchsorted(self.keys, grams + max_length[rows], side='right') - starts, 0)
+        total = int(sizes.sum())
+        position = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+        pattern_ids = self.ids[np.repeat(starts, sizes) + position]
+        shared = np.bincount(np.repeat(rows, sizes) * pattern_count + pattern_ids,
+                             minlength=len(queries) * pattern_count).reshape(len(queries), pattern_count)
+        
+        # Most shared bigrams first, lower ids first on ties
+        keys = shared * pattern_count - np.arange(pattern_count)
+        keep = min(top_k, pattern_count)
+        top = np.argpartition(-keys, keep - 1, axis=1)[:, :keep]
+        candidates = []
+        for row, ids in enumerate(top):
+            ids = ids[np.argsort(-keys[row, ids], kind='stable')]
+            candidates.append([int(i) for i in ids if shared[row, i] > 0])
+        return candidates
+
+class PatternUsage(dict):
+    """Per-pattern use counts that also keep the most used patterns under each trigram"""
+    
+    TOP = 8   # patterns kept per trigram; suggestions ask for three
+    
+    def __init__(self):
+        super().__init__()
+        self.ranked = {}   # trigram -> up to TOP used patterns containing it, most used first
+    
+    def __missing__(self, pattern):
+        return 0
+    
+    def __setitem__(self, pattern, count):
+        previous = self.get(pattern, 0)
+        super().__setitem__(pattern, count)
+        # Re-rank only when a count passes a power of two, so a busy pattern costs O(log n) updates;
+        # readers sort the short lists by exact count
+        if count.bit_length() == previous.bit_length():
+            return
+        ranked = self.ranked
+        counts = self.get
+        for gram in {pattern[i:i + 3] for i in range(len(pattern) - 2)}:
+            top = ranked.get(gram)
+            if top is None:
+                ranked[gram] = [pattern]
+                continue
+            if pattern in top:
+                i = top.index(pattern)
+            elif len(top) < self.TOP:
+                top.append(pattern)
+                i = len(top) - 1
+            elif count > counts(top[-1]):
+                top[-1] = pattern
+                i = len(top) - 1
+            else:
+                continue
+            while i and count > counts(top[i - 1]):
+                top[i - 1], top[i] = top[i], top[i - 1]
+                i -= 1
+    
+    def top(self, probe):
+        """Used patterns containing a three-character probe, or None for a probe too short to rank"""
+        if len(probe) != 3:
+            return None
+        return list(self.ranked.get(probe, ()))
+
+class SuggestionIndex:
+    """Sorted key list for prefix lookups plus a trigram inverted index for substrings"""
+    
+    # Short probes and plain count mappings only rerank this many lookup results by usage
+    RANK_CANDIDATES = 64
+    
+    def __init__(self):
+        self.patterns = []      # pattern id -> pattern key, in learned order
+        self.ids = {}           # pattern key -> pattern id
+        self.sorted_keys = []   # pattern keys in lexicographic order, searched with bisect
+        self.trigrams = {}      # trigram -> array of pattern ids, ascending
+        self.short = []         # ids of patterns too short to have a trigram
+    
+    def build(self, dfas):
+        """Index every pattern key from scratch"""
+        self.patterns = list(dfas)
+        self.ids = {pattern: i for i, pattern in enumerate(self.patterns)}
+        self.sorted_keys = sorted(self.patterns)
+        self.trigrams = {}
+        self.short = []
+        for pattern_id, pattern in enumerate(self.patterns):
+            self._index_grams(pattern_id, pattern)
+    
+    def add(self, pattern):
+        """Incrementally index one new pattern key"""
+        if pattern in self.ids:
+            return
+        pattern_id = len(self.patterns)
+        self.patterns.append(pattern)
+        self.ids[pattern] = pattern_id
+        bisect.insort(self.sorted_keys, pattern)
+        self._index_grams(pattern_id, pattern)
+    
+    def _index_grams(self, pattern_id, pattern):
+        if len(pattern) < 3:
+            self.short.append(pattern_id)
+            return
+        for gram in {pattern[i:i + 3] for i in range(len(pattern) - 2)}:
+            postings = self.trigrams.get(gram)
+            if postings is None:
+                postings = self.trigrams[gram] = array('I')
+            postings.append(pattern_id)
+    
+    def prefixed(self, prefix):
+        """Pattern keys starting with prefix, in lexicographic order"""
+        keys = self.sorted_keys
+        for i in range(bisect.bisect_left(keys, prefix), len(keys)):
+            if not keys[i].startswith(prefix):
+                break
+            yield keys[i]
+    
+    def containing(self, probe):
+        """Pattern keys containing probe, in learned order"""
+        if len(probe) == 3:
+            ids = self.trigrams.get(probe, ())
+        elif len(probe) < 3:
+            # Every occurrence of a short probe lies inside some trigram of the pattern
+            lists = [postings for gram, postings in self.trigrams.items() if probe in gram]
+            lists.append([i for i in self.short if probe in self.patterns[i]])
+            ids = (i for i, _ in groupby(heapq.merge(*lists)))
+        else:
+            grams = [self.trigrams.get(probe[i:i + 3], ()) for i in range(len(probe) - 2)]
+            ids = (i for i in min(grams, key=len) if probe in self.patterns[i])
+        for pattern_id in ids:
+            yield self.patterns[pattern_id]
+    
+    def suggest(self, probe, usage=None, limit=3):
+        """Up to limit keys containing probe: most used first, then prefix matches, then the rest"""
+        return self.suggest_across([self], probe, usage, limit)
+    
+    @staticmethod
+    def suggest_across(indexes, probe, usage=None, limit=3):
+        """suggest() over several indexes, e.g. a base pattern set and its learned overlay"""
+        chosen = []
+        if usage:
+            used = usage.top(probe) if isinstance(usage, PatternUsage) else None
+            if used is None:
+                window = islice(SuggestionIndex._lookup(indexes, probe), SuggestionIndex.RANK_CANDIDATES)
+                used = [pattern for pattern in dict.fromkeys(window) if usage.get(pattern, 0) > 0]
+            used = [pattern for pattern in used if any(pattern in index.ids for index in indexes)]
+            used.sort(key=lambda pattern: (-usage[pattern], not pattern.startswith(probe), pattern))
+            chosen = used[:limit]
+        for pattern in SuggestionIndex._lookup(indexes, probe):
+            if len(chosen) >= limit:
+                break
+            if pattern not in chosen:
+                chosen.append(pattern)
+        return chosen
+    
+    @staticmethod
+    def _lookup(indexes, probe):
+        # The generators are lazy, so only the first few matches are ever visited
+        prefixed = heapq.merge(*[index.prefixed(probe) for index in indexes])
+        containing = chain.from_iterable(index.containing(probe) for index in indexes)
+        return chain(prefixed, containing)
+
+class KeywordIndex:
+    """Aho-Corasick automaton that finds pattern phrases anywhere in a message"""
+    
+    def __init__(self):
+        self.patterns = []   # pattern id -> pattern key
+        self.goto = [{}]     # trie state -> {char: next state}
+        self.fail = [0]      # longest proper suffix that is also a trie state
+        self.output = [-1]   # pattern id ending exactly at this state
+        self.dict_link = [-1]  # nearest state on the fail chain with an output
+        self.linked = True
+    
+    def build(self, dfas):
+        """Index every pattern key from scratch"""
+        self.patterns = []
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [-1]
+        self.dict_link = [-1]
+        for pattern in dfas:
+            self.add(pattern)
+        self._link()
+    
+    def add(self, pattern):
+        """Insert one phrase; failure links are recomputed on the next search"""
+        if not pattern:
+            return
+        goto = self.goto
+        state = 0
+        for ch in pattern:
+            next_state = goto[state].get(ch)
+            if next_state is None:
+                next_state = len(goto)
+                goto.append({})
+                self.fail.append(0)
+                self.output.append(-1)
+                self.dict_link.append(-1)
+                goto[state][ch] = next_state
+            state = next_state
+        if self.output[state] < 0:
+            self.output[state] = len(self.patterns)
+            self.patterns.append(pattern)
+        self.linked = False
+    
+    def _link(self):
+        """Breadth-first pass computing failure and dictionary-suffix links"""
+        goto, fail, output, dict_link = self.goto, self.fail, self.output, self.dict_link
+        queue = deque()
+        for child in goto[0].values():
+            fail[child] = 0
+            dict_link[child] = -1
+            queue.append(child)
+        while queue:
+            state = queue.popleft()
+            for ch, child in goto[state].items():
+                fallback = fail[state]
+                while fallback and ch not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[child] = goto[fallback].get(ch, 0)
+                target = fail[child]
+                dict_link[child] = target if output[target] >= 0 else dict_link[target]
+                queue.append(child)
+        self.linked = True
+    
+    def search(self, text):
+        """All whole-word phrase occurrences in one pass; returns (start, pattern) pairs"""
+        if not self.linked:
+            self._link()
+        goto, fail, output, dict_link, patterns = self.goto, self.fail, self.output, self.dict_link, self.patterns
+        hits = []
+        state = 0
+        for end, ch in enumerate(text, 1):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            found = state if output[state] >= 0 else dict_link[state]
+            while found > 0:
+                pattern = patterns[output[found]]
+                start = end - len(pattern)
+                # Only whole words count: "hi" must not fire inside "this"
+                if ((start == 0 or not text[start - 1].isalnum())
+                        and (end == len(text) or not text[end].isalnum())):
+                    hits.append((start, pattern))
+                found = dict_link[found]
+        return hits
+
+class CategoryIndex:
+    """Pattern count per category, so statistics never rescan the pattern set"""
+    
+    def __init__(self):
+        self.counts = Counter()
+    
+    def build(self, dfas):
+        self.counts = Counter(data.get('category', 'unknown') for data in dfas.values())
+
+class StageMetrics:
+    """Latency histograms per matching stage plus patterns-tried and outcome counters"""
+    
+    # Histogram upper bounds, Prometheus style (seconds / patterns); +Inf is implied
+    LATENCY_BUCKETS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025,
+                       0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+    TRIED_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096, 16384, 65536)
+    
+    def __init__(self):
+        self.reset()
+    
+    def reset(self):
+        """Drop every recorded observation"""
+        self.latency = {}   # stage -> [bucket counts..., +Inf count]
+        self.latency_sum = defaultdict(float)
+        self.tried = [0] * (len(self.TRIED_BUCKETS) + 1)
+        self.tried_sum = 0
+        self.outcomes = Counter()
+        self.events = Counter()   # rare engine events such as reloads and reload failures
+        self.started = time.time()
+    
+    def observe(self, stage, seconds):
+        """Record one stage duration"""
+        # Unlocked on purpose: concurrent sessions may rarely lose an increment
+        buckets = self.latency.get(stage)
+        if buckets is None:
+            buckets = self.latency[stage] = [0] * (len(self.LATENCY_BUCKETS) + 1)
+        buckets[bisect.bisect_left(self.LATENCY_BUCKETS, seconds)] += 1
+        self.latency_sum[stage] += seconds
+    
+    def lap(self, stage, since):
+        """Record the time since `since` under stage and return the new mark"""
+        now = time.perf_counter()
+        self.observe(stage, now - since)
+        return now
+    
+    def count(self, event):
+        """Bump an engine event counter"""
+        self.events[event] += 1
+    
+    def observe_tried(self, count, outcome):
+        """Record how many patterns one message was compared against, and how it ended"""
+        self.tried[bisect.bisect_left(self.TRIED_BUCKETS, count)] += 1
+        self.tried_sum += count
+        self.outcomes[outcome] += 1
+    
+    @staticmethod
+    def quantile(buckets, bounds, q):
+        """Upper bucket bound below which a fraction q of the observations fall"""
+        total = sum(buckets)
+        if not total:
+            return 0.0
+        running = 0
+        for bound, count in zip(bounds + (math.inf,), buckets):
+            running += count
+            if running >= q * total:
+                return bound
+        return math.inf
+    
+    def summary(self):
+        """Per-stage (stage, count, mean, p50, p99) rows in seconds"""
+        rows = []
+        for stage, buckets in self.latency.items():
+            count = sum(buckets)
+            rows.append((stage, count, self.latency_sum[stage] / count,
+                         self.quantile(buckets, self.LATENCY_BUCKETS, 0.5),
+                         self.quantile(buckets, self.LATENCY_BUCKETS, 0.99)))
+        return rows
+    
+    def snapshot(self):
+        """JSON-serializable copy of every histogram and counter"""
+        bound = lambda value: "+Inf" if value == math.inf else value
+        return {
+            'started': datetime.fromtimestamp(self.started).isoformat(),
+            'latency_buckets': list(self.LATENCY_BUCKETS) + ["+Inf"],
+            'stages': {stage: {'buckets': list(buckets), 'count': sum(buckets),
+                               'sum': self.latency_sum[stage],
+                               'p50': bound(self.quantile(buckets, self.LATENCY_BUCKETS, 0.5)),
+                               'p99': bound(self.quantile(buckets, self.LATENCY_BUCKETS, 0.99))}
+                       for stage, buckets in self.latency.items()},
+            'patterns_tried': {'buckets': list(self.tried), 'bounds': list(self.TRIED_BUCKETS) + ["+Inf"],
+                               'count': sum(self.tried), 'sum': self.tried_sum},
+            'outcomes': dict(self.outcomes),
+            'events': dict(self.events)
         }
+    
+    def to_prometheus(self, prefix="dfa_chatbot"):
+        """Prometheus text exposition format (cumulative buckets)"""
+        def histogram(name, labels, buckets, bounds, total):
+            lines = []
+            running = 0
+            for upper, count in zip(bounds + (math.inf,), buckets):
+                running += count
+                le = "+Inf" if upper == math.inf else repr(upper)
+                lines.append(f'{name}_bucket{{{labels}le="{le}"}} {running}')
+            lines.append(f"{name}_sum{{{labels.rstrip(',')}}} {total}")
+            lines.append(f"{name}_count{{{labels.rstrip(',')}}} {running}")
+            return lines
+        
+        lines = [f"# HELP {prefix}_stage_seconds Latency of each matching pipeline stage",
+                 f"# TYPE {prefix}_stage_seconds histogram"]
+        for stage, buckets in self.latency.items():
+            lines += histogram(f"{prefix}_stage_seconds", f'stage="{stage}",', buckets,
+                               self.LATENCY_BUCKETS, self.latency_sum[stage])
+        lines += [f"# HELP {prefix}_patterns_tried Patterns compared against one message",
+                  f"# TYPE {prefix}_patterns_tried histogram"]
+        lines += histogram(f"{prefix}_patterns_tried", "", self.tried, self.TRIED_BUCKETS, self.tried_sum)
+        lines += [f"# HELP {prefix}_matches_total Matched messages by match type",
+                  f"# TYPE {prefix}_matches_total counter"]
+        lines += [f'{prefix}_matches_total{{type="{outcome}"}} {count}' for outcome, count in self.outcomes.items()]
+        lines += [f"# HELP {prefix}_events_total Engine events such as pattern reloads",
+                  f"# TYPE {prefix}_events_total counter"]
+        lines += [f'{prefix}_events_total{{event="{event}"}} {count}' for event, count in self.events.items()]
+        return "\n".join(lines) + "\n"
+    
+    def export(self, path):
+        """Write a .json snapshot, or Prometheus text for any other extension"""
+        with open(path, 'w', encoding='utf-8') as f:
+            if path.endswith('.json'):
+                json.dump(self.snapshot(), f, indent=2)
+            else:
+                f.write(self.to_prometheus())
+
+class SpaceSaving:
+    """Space-Saving top-k: approximate heavy hitters of a stream in k counters"""
+    
+    def __init__(self, k=50):
+        self.k = k
+        self.counts = {}   # item -> count, an overestimate by at most errors[item]
+        self.errors = {}
+    
+    def add(self, item):
+        counts = self.counts
+        if item in counts:
+            counts[item] += 1
+        elif len(counts) < self.k:
+            counts[item] = 1
+            self.errors[item] = 0
+        else:
+            # The newcomer inherits the smallest counter, which bounds its error
+            victim = min(counts, key=counts.get)
+            floor = counts.pop(victim)
+            del self.errors[victim]
+            counts[item] = floor + 1
+            self.errors[item] = floor
+    
+    def top(self, n=None):
+        """[(item, count, max overestimate)], most frequent first"""
+        ranked = sorted(self.counts.items(), key=lambda entry: (-entry[1], entry[0]))[:n]
+        return [(item, count, self.errors[item]) for item, count in ranked]
+
+class HyperLogLog:
+    """Distinct-count estimate in 2**precision one-byte registers (about 1.6% error at 12)"""
+    
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+    
+    def add(self, item):
+        # Stable 64-bit hash, unlike hash(), so sketches from different processes can be merged
+        x = int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'big')
+        rest_bits = 64 - self.precision
+        index = x >> rest_bits
+        rank = rest_bits - (x & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+    
+    def merge(self, other):
+        """Fold in a sketch of the same precision; the result counts the union of both streams"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+    
+    def count(self):
+        registers = self.registers
+        m = len(registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in registers)
+        zeros = registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+class WindowedCounts:
+    """Hit and miss counts over a sliding time window, kept in a fixed ring of time slots"""
+    
+    def __init__(self, span=900.0, slots=60):
+        self.resolution = span / slots
+        self.stamps = [-1] * slots   # absolute slot number each ring entry currently holds
+        self.hits = [0] * slots
+        self.misses = [0] * slots
+    
+    def add(self, hit, now=None):
+        slot = int((time.time() if now is None else now) // self.resolution)
+        i = slot % len(self.stamps)
+        if self.stamps[i] != slot:
+            self.stamps[i] = slot
+            self.hits[i] = self.misses[i] = 0
+        if hit:
+            self.hits[i] += 1
+        else:
+            self.misses[i] += 1
+    
+    def totals(self, seconds, now=None):
+        """(hits, misses) over roughly the last `seconds`, rounded up to whole slots"""
+        slot = int((time.time() if now is None else now) // self.resolution)
+        hits = misses = 0
+        for back in range(min(len(self.stamps), max(1, math.ceil(seconds / self.resolution)))):
+            i = (slot - back) % len(self.stamps)
+            if self.stamps[i] == slot - back:
+                hits += self.hits[i]
+                misses += self.misses[i]
+        return hits, misses
+
+class TrafficAnalytics:
+    """Fixed-memory view of live traffic: category hits, windowed hit rates, top misses, distinct inputs"""
+    
+    WINDOWS = (60, 300, 900)   # seconds reported by hit_rates()
+    MAX_INPUT_LENGTH = 200     # longer inputs are truncated before counting, so memory stays fixed
+    
+    def __init__(self, top_k=50):
+        self.top_k = top_k
+        self.lock = threading.Lock()   # Space-Saving evictions must not interleave
+        self.reset()
+    
+    def reset(self):
+        self.messages = 0
+        self.category_hits = Counter()   # bounded by the categories in the pattern set
+        self.window = WindowedCounts(max(self.WINDOWS))
+        self.unmatched = SpaceSaving(self.top_k)
+        self.distinct = HyperLogLog()
+        self.distinct_unmatched = HyperLogLog()
+        self.started = time.time()
+    
+    def record(self, user_input, match_result):
+        """Count one normalized message and how it was matched"""
+        item = user_input[:self.MAX_INPUT_LENGTH]
+        hit = match_result['type'] != 'no_match'
+        with self.lock:
+            self.messages += 1
+            self.window.add(hit)
+            self.distinct.add(item)
+            if hit:
+                self.category_hits[match_result['data'].get('category', 'unknown')] += 1
+            else:
+                self.unmatched.add(item)
+                self.distinct_unmatched.add(item)
+    
+    def hit_rates(self):
+        """[(window seconds, hits, misses)] for each reported window"""
+        now = time.time()
+        return [(seconds, *self.window.totals(seconds, now)) for seconds in self.WINDOWS]
+    
+    def snapshot(self):
+        """JSON-serializable copy of every counter and estimate"""
+        return {
+            'started': datetime.fromtimestamp(self.started).isoformat(),
+            'messages': self.messages,
+            'distinct_inputs': self.distinct.count(),
+            'distinct_unmatched': self.distinct_unmatched.count(),
+            'category_hits': dict(self.category_hits),
+            'windows': [{'seconds': seconds, 'hits': hits, 'misses': misses}
+                        for seconds, hits, misses in self.hit_rates()],
+            'top_unmatched': [{'input': item, 'count': count, 'max_overcount': error}
+                              for item, count, error in self.unmatched.top()]
+        }
+
+class LRUCache:
+    """Bounded least-recently-used mapping"""
+    
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.tag = None   # what the entries were computed against, e.g. a snapshot version
+    
+    def get(self, key):
+        """Return the cached value (refreshing its recency) or None"""
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+        return value
+    
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entries past maxsize"""
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+    
+    def clear(self):
+        self.entries.clear()
+    
+    def __len__(self):
+        return len(self.entries)
+
+class ConversationHistory:
+    """Bounded ring of recent entries backed by an append-only JSONL spill file"""
+    
+    def __init__(self, maxlen=500, spill_path=None, flush_every=64):
+        self.recent = deque(maxlen=maxlen)
+        self.spill_path = spill_path
+        self.flush_every = flush_every
+        self.count = 0
+        self._pending = []
+        self._spill = None
+    
+    def append(self, entry):
+        """Record an entry; spill lines are written in batches of flush_every"""
+        self.recent.append(entry)
+        self.count += 1
+        if self.spill_path:
+            self._pending.append(json.dumps(entry, ensure_ascii=False, default=list) + "\n")
+            if len(self._pending) >= self.flush_every:
+                self.flush()
+    
+    def flush(self):
+        """Write pending entries to the spill file in one batch"""
+        if not self._pending:
+            return
+        if self._spill is None:
+            self._spill = self._open(self.spill_path, 'at')
+        self._spill.writelines(self._pending)
+        self._spill.flush()
+        self._pending.clear()
+    
+    def close(self):
+        """Flush and close the spill file (it is reopened on the next flush)"""
+        self.flush()
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+    
+    def resize(self, maxlen):
+        """Keep up to maxlen recent entries in memory from now on"""
+        self.recent = deque(self.recent, maxlen=maxlen)
+    
+    def clear(self):
+        """Forget every entry, in memory and on disk"""
+        self.recent.clear()
+        self._pending.clear()
+        self.count = 0
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        if self.spill_path and os.path.exists(self.spill_path):
+            os.remove(self.spill_path)
+    
+    def __iter__(self):
+        """Stream the full history from disk when spilling, else the in-memory ring"""
+        if not self.spill_path:
+            yield from list(self.recent)
+            return
+        # Closing finishes the gzip member so the file is readable end to end
+        self.close()
+        if not os.path.exists(self.spill_path):
+            return
+        with self._open(self.spill_path, 'rt') as f:
+            for line in f:
+                yield json.loads(line)
+    
+    def __len__(self):
+        return self.count
+    
+    def frozen(self):
+        """The history as of now, safe to stream from another thread while chatting goes on"""
+        if not self.spill_path:
+            return list(self.recent)
+        self.close()
+        if not os.path.exists(self.spill_path):
+            return []
+        # Later appends land past this size, so the reader never sees a half-written batch
+        return self._replay(self.spill_path, os.path.getsize(self.spill_path))
+    
+    @staticmethod
+    def _replay(path, size):
+        with open(path, 'rb') as raw:
+            stream = io.BufferedReader(BoundedReader(raw, size))
+            if path.endswith('.gz'):
+                stream = gzip.GzipFile(fileobj=stream)
+            for line in io.TextIOWrapper(stream, encoding='utf-8'):
+                yield json.loads(line)
+    
+    @staticmethod
+    def _open(path, mode):
+        if path.endswith('.gz'):
+            return gzip.open(path, mode, encoding='utf-8')
+        return open(path, mode, encoding='utf-8')
+
+class BoundedReader(io.RawIOBase):
+    """Read-only view of the first `limit` bytes of a binary file"""
+    
+    def __init__(self, raw, limit):
+        self.raw = raw
+        self.remaining = limit
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        data = self.raw.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+class ExportFile:
+    """Buffered, optionally gzip- or zstd-compressed text file written in chunks of lines"""
+    
+    SUFFIXES = {'none': '', 'gzip': '.gz', 'zstd': '.zst'}
+    CHUNK_LINES = 256
+    
+    def __init__(self, path, compression='none'):
+        if compression not in self.SUFFIXES:
+            raise ValueError(f"unknown compression '{compression}' (use none, gzip or zstd)")
+        if compression == 'zstd' and zstandard is None:
+            compression = 'gzip'
+        self.compression = compression
+        self.path = path + self.SUFFIXES[compression]
+        self.stream = None
+    
+    def __enter__(self):
+        if self.compression == 'gzip':
+            self.stream = gzip.open(self.path, 'wt', encoding='utf-8', compresslevel=6)
+        elif self.compression == 'zstd':
+            writer = zstandard.ZstdCompressor().stream_writer(open(self.path, 'wb'))
+            self.stream = io.TextIOWrapper(writer, encoding='utf-8')
+        else:
+            self.stream = open(self.path, 'w', encoding='utf-8', buffering=1 << 16)
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.stream.close()
+    
+    def write_lines(self, lines):
+        """Write an iterable of lines, joined into one write per chunk"""
+        lines = iter(lines)
+        while True:
+            chunk = list(islice(lines, self.CHUNK_LINES))
+            if not chunk:
+                break
+            self.stream.write("".join(chunk))
+    
+    @staticmethod
+    def open_text(path, newline=None):
+        """Read back a file written by ExportFile (or any plain .json/.jsonl/.csv file)"""
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt', encoding='utf-8', newline=newline)
+        if path.endswith('.zst'):
+            if zstandard is None:
+                raise ValueError(f"{path}: reading .zst files needs the zstandard package")
+            reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'))
+            return io.TextIOWrapper(reader, encoding='utf-8', newline=newline)
+        return open(path, 'r', encoding='utf-8', newline=newline)
+
+class PatternJournal:
+    """Append-only journal of learned patterns, compacted atomically into a JSON snapshot"""
+    
+    def __init__(self, snapshot_path='custom_patterns.json', journal_path='custom_patterns.journal',
+                 compact_every=256):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.compact_every = compact_every
+        self.records = 0   # journal records not yet folded into the snapshot
+    
+    def append(self, pattern, data):
+        """Durably append one learn event as a checksummed line"""
+        payload = json.dumps({'pattern': pattern, 'data': data}, ensure_ascii=False, default=str)
+        line = f"{zlib.crc32(payload.encode('utf-8')):08x} {payload}\n"
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        self.records += 1
+    
+    def load(self):
+        """Replay snapshot plus journal tail; returns (patterns, skipped record count)"""
+        patterns = {}
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                patterns = json.load(f)
+        
+        skipped = 0
+        self.records = 0
+        if os.path.exists(self.journal_path):
+            good_end = 0
+            with open(self.journal_path, 'rb') as f:
+                for line in f:
+                    record = self._decode(line)
+                    if record is None:
+                        skipped += 1
+                        continue
+                    patterns[record['pattern']] = record['data']
+                    self.records += 1
+                    good_end = f.tell()
+                end = f.tell()
+            # Drop a torn final write so the next append starts on a clean line
+            if skipped and good_end < end:
+                with open(self.journal_path, 'r+b') as f:
+                    f.truncate(good_end)
+        return patterns, skipped
+    
+    def compact(self, patterns):
+        """Atomically replace the snapshot with the given patterns and empty the journal"""
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(patterns, f, indent=2, ensure_ascii=False, default=str)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        # A crash before this truncate only replays records the snapshot already has
+        open(self.journal_path, 'w').close()
+        self.records = 0
+    
+    def load_record_count(self):
+        """Count journal lines without replaying them"""
+        if not os.path.exists(self.journal_path):
+            return 0
+        with open(self.journal_path, 'rb') as f:
+            return sum(1 for _ in f)
+    
+    def needs_compaction(self):
+        return self.records >= self.compact_every
+    
+    @staticmethod
+    def _decode(line):
+        """Parse one journal line, returning None for torn or corrupted records"""
+        if not line.endswith(b"\n"):
+            return None
+        checksum, _, payload = line.rstrip(b"\r\n").partition(b" ")
+        try:
+            if int(checksum, 16) != zlib.crc32(payload):
+                return None
+            return json.loads(payload.decode('utf-8'))
+        except ValueError:
+            return None
+
+class StringTable(Sequence):
+    """Read-only list of strings stored as an offset array plus a UTF-8 blob"""
+    
+    def __init__(self, offsets, blob, order=None):
+        self.offsets = offsets   # len + 1 byte offsets into blob
+        self.blob = blob
+        self.order = order       # indexes sorted by string, for find()
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        return bytes(self.blob[self.offsets[index]:self.offsets[index + 1]]).decode('utf-8')
+    
+    def find(self, text):
+        """Binary search through the sorted order; returns the index or -1"""
+        key = text.encode('utf-8')
+        order = self.order
+        low, high = 0, len(order)
+        while low < high:
+            mid = (low + high) // 2
+            index = order[mid]
+            probe = bytes(self.blob[self.offsets[index]:self.offsets[index + 1]])
+            if probe < key:
+                low = mid + 1
+            elif probe > key:
+                high = mid
+            else:
+                return index
+        return -1
+    
+    @staticmethod
+    def pack(strings):
+        """Encode strings into (offsets array, blob bytes, sorted order array)"""
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = array('Q', [0])
+        for item in encoded:
+            offsets.append(offsets[-1] + len(item))
+        order = array('I', sorted(range(len(encoded)), key=encoded.__getitem__))
+        return offsets, b"".join(encoded), order
+
+class IndexedStrings(Sequence):
+    """View of a StringTable through an index array, e.g. accept label -> pattern position"""
+    
+    def __init__(self, indexes, strings):
+        self.indexes = indexes
+        self.strings = strings
+    
+    def __len__(self):
+        return len(self.indexes)
+    
+    def __getitem__(self, index):
+        return self.strings[self.indexes[index]]
+
+class MappedPatterns(MutableMapping):
+    """Pattern dictionary backed by a PatternStore; entries are decoded on first access"""
+    
+    def __init__(self, keys, entries):
+        self.keys_table = keys
+        self.entries_table = entries
+        self.decoded = {}    # base index -> entry dict
+        self.overlay = {}    # learned or replaced entries
+        self.deleted = set()
+    
+    def __getitem__(self, pattern):
+        if pattern in self.overlay:
+            return self.overlay[pattern]
+        index = self.keys_table.find(pattern)
+        if index < 0 or pattern in self.deleted:
+            raise KeyError(pattern)
+        entry = self.decoded.get(index)
+        if entry is None:
+            entry = self.decoded[index] = json.loads(self.entries_table[index])
+        return entry
+    
+    def __setitem__(self, pattern, data):
+        self.deleted.discard(pattern)
+        self.overlay[pattern] = data
+    
+    def __delitem__(self, pattern):
+        if pattern not in self:
+            raise KeyError(pattern)
+        self.overlay.pop(pattern, None)
+        if self.keys_table.find(pattern) >= 0:
+            self.deleted.add(pattern)
+    
+    def __contains__(self, pattern):
+        if pattern in self.overlay:
+            return True
+        return pattern not in self.deleted and self.keys_table.find(pattern) >= 0
+    
+    def __iter__(self):
+        for pattern in self.keys_table:
+            if pattern not in self.deleted:
+                yield pattern
+        for pattern in self.overlay:
+            if self.keys_table.find(pattern) < 0:
+                yield pattern
+    
+    def __len__(self):
+        added = sum(1 for pattern in self.overlay if self.keys_table.find(pattern) < 0)
+        return len(self.keys_table) - len(self.deleted) + added
+    
+    def with_entries(self, entries):
+        """New mapping over the same tables with extra overlay entries; self is unchanged"""
+        mapped = MappedPatterns(self.keys_table, self.entries_table)
+        mapped.decoded = self.decoded   # stored entries never change, so the decode cache is shared
+        mapped.overlay = {**self.overlay, **entries}
+        mapped.deleted = self.deleted - entries.keys()
+        return mapped
+
+class LayeredPatterns(Mapping):
+    """Read-only view of base patterns plus newly learned ones, without copying the base"""
+    
+    def __init__(self, base, added):
+        self.base = base
+        self.added = added   # never overlaps base: learn() rejects existing patterns
+    
+    def __getitem__(self, pattern):
+        if pattern in self.added:
+            return self.added[pattern]
+        return self.base[pattern]
+    
+    def __contains__(self, pattern):
+        return pattern in self.added or pattern in self.base
+    
+    def __iter__(self):
+        yield from self.base
+        yield from self.added
+    
+    def __len__(self):
+        return len(self.base) + len(self.added)
+
+class PatternStore:
+    """Versioned binary file of compiled tables and pattern metadata, opened with mmap"""
+    
+    MAGIC = b"DFAB"
+    VERSION = 6
+    SECTIONS = [('classes', 'I'), ('base', 'i'), ('check', 'i'), ('next', 'i'), ('accept', 'i'),
+                ('labels', 'I'), ('weights', 'i'), ('counts', 'I'),
+                ('regex_classes', 'I'), ('regex_base', 'i'), ('regex_check', 'i'), ('regex_next', 'i'),
+                ('regex_accept', 'i'), ('regex_labels', 'I'), ('regex_wins', 'I'), ('regex_keys', 'I'),
+                ('key_offsets', 'Q'), ('keys', 'B'), ('key_order', 'I'),
+                ('entry_offsets', 'Q'), ('entries', 'B')]
+    HEADER = struct.Struct("=4sIc3x32sQQ" + "QQ" * len(SECTIONS))
+    
+    @classmethod
+    def write(cls, path, dfas, union, source_hash):
+        """Serialize a pattern dictionary and its compiled union DFA, replacing the file atomically"""
+        patterns = list(dfas)
+        pattern_ids = {pattern: i for i, pattern in enumerate(patterns)}
+        compiled = union.compiled
+        # Accept labels (or word ranks) resolve to pattern positions in the key table
+        labels = array('I', (pattern_ids[label] for label in compiled.labels))
+        weights = compiled.weights if compiled.weights is not None else array('i')
+        counts = compiled.counts if compiled.counts is not None else array('I')
+        classes = cls._class_codes(compiled)
+        # Empty regex sections mean the pattern set has no regex automaton
+        general = union.general
+        if general is not None:
+            regex_tables = [cls._class_codes(general), general.base, general.check, general.next, general.accept,
+                            array('I', (pattern_ids[label] for label in general.labels)),
+                            array('I', (pattern_ids[pattern] for pair in union.regex_wins for pattern in pair))]
+        else:
+            regex_tables = [array('I'), array('i'), array('i'), array('i'), array('i'), array('I'), array('I')]
+        regex_tables.append(array('I', sorted(pattern_ids[pattern] for pattern in union.regex_patterns)))
+        key_offsets, keys, key_order = StringTable.pack(patterns)
+        entry_offsets, entries, _ = StringTable.pack(
+            json.dumps(dfas[pattern], ensure_ascii=False, default=str) for pattern in patterns)
+        
+        sections = [classes, compiled.base, compiled.check, compiled.next, compiled.accept,
+                    labels, weights, counts, *regex_tables, key_offsets, keys, key_order, entry_offsets, entries]
+        blobs = [bytes(section) if isinstance(section, bytes) else section.tobytes() for section in sections]
+        
+        layout = []
+        offset = cls.HEADER.size
+        for blob in blobs:
+            offset += -offset % 8   # keep every section 8-byte aligned for memoryview casts
+            layout.extend((offset, len(blob)))
+            offset += len(blob)
+        byteorder = b"l" if sys.byteorder == 'little' else b"b"
+        
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            # The header goes in last, once the body's checksum is known
+            f.write(b"\0" * cls.HEADER.size)
+            checksum = 0
+            for blob, section_offset in zip(blobs, layout[::2]):
+                padding = b"\0" * (section_offset - f.tell())
+                checksum = zlib.crc32(blob, zlib.crc32(padding, checksum))
+                f.write(padding)
+                f.write(blob)
+            f.seek(0)
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, byteorder, source_hash, union.states_before,
+                                    checksum, *layout))
+        os.replace(tmp_path, path)
+    
+    @staticmethod
+    def _class_codes(compiled):
+        """Code point of each character class, indexed by class id - 1"""
+        codes = array('I', [0] * len(compiled.classes))
+        for ch, class_id in compiled.classes.items():
+            codes[class_id - 1] = ord(ch)
+        return codes
+    
+    @classmethod
+    def open(cls, path, source_hash, minimize=True):
+        """Map a store file; returns (MappedPatterns, UnionDFA over its tables) or None"""
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mapped) < cls.HEADER.size:
+            return None
+        magic, version, byteorder, stored_hash, states_before, checksum, *layout = cls.HEADER.unpack_from(mapped)
+        native = b"l" if sys.byteorder == 'little' else b"b"
+        if (magic, version, byteorder, stored_hash) != (cls.MAGIC, cls.VERSION, native, source_hash):
+            return None
+        
+        # A truncated or bit-rotted store falls back to the JSON sources here rather than
+        # failing later, at match time, when a damaged section is first decoded
+        view = memoryview(mapped)
+        sections = list(zip(cls.SECTIONS, layout[::2], layout[1::2]))
+        for (name, typecode), offset, length in sections:
+            if offset < cls.HEADER.size or offset + length > len(mapped) or length % array(typecode).itemsize:
+                return None
+        if zlib.crc32(view[cls.HEADER.size:]) != checksum:
+            return None
+        tables = {}
+        for (name, typecode), offset, length in sections:
+            tables[name] = view[offset:offset + length].cast(typecode)
+        
+        keys = StringTable(tables['key_offsets'], tables['keys'], tables['key_order'])
+        entries = StringTable(tables['entry_offsets'], tables['entries'])
+        classes = {chr(code): i + 1 for i, code in enumerate(tables['classes'])}
+        weights = tables['weights'] if len(tables['weights']) else None
+        counts = tables['counts'] if len(tables['counts']) else None
+        compiled = CompiledDFA.from_tables(classes, tables['base'], tables['check'], tables['next'],
+                                           tables['accept'], IndexedStrings(tables['labels'], keys),
+                                           weights, counts)
+        general = None
+        regex_wins = frozenset()
+        if len(tables['regex_base']):
+            regex_classes = {chr(code): i + 1 for i, code in enumerate(tables['regex_classes'])}
+            general = CompiledDFA.from_tables(regex_classes, tables['regex_base'], tables['regex_check'],
+                                              tables['regex_next'], tables['regex_accept'],
+                                              IndexedStrings(tables['regex_labels'], keys))
+            wins = [keys[i] for i in tables['regex_wins']]
+            regex_wins = frozenset(zip(wins[::2], wins[1::2]))
+        regex_patterns = frozenset(keys[i] for i in tables['regex_keys'])
+        union = UnionDFA(minimize)
+        union.load_compiled(compiled, states_before, general, regex_wins, regex_patterns)
+        return MappedPatterns(keys, entries), union
+
+class PatternIndexes:
+    """Fuzzy, keyword, suggestion and category indexes over one immutable pattern mapping, built on first use"""
+    
+    KINDS = {'fuzzy': FuzzyIndex, 'keyword': KeywordIndex, 'suggestion': SuggestionIndex,
+             'category': CategoryIndex}
+    # A regex entry's key is its source, e.g. "thanks?", so phrase indexes leave it out
+    PHRASE_KINDS = ('fuzzy', 'keyword', 'suggestion')
+    
+    def __init__(self, dfas, regexes=None):
+        self.dfas = dfas
+        self.regexes = regexes   # keys of regex entries; found by reading the entries when not given
+        self.built = {}
+        self.lock = threading.Lock()
+    
+    def get(self, kind):
+        """The index of the given kind, building it if this is the first lookup"""
+        index = self.built.get(kind)
+        if index is None:
+            # Only a first lookup takes the lock; afterwards reads are lock-free
+            with self.lock:
+                index = self.built.get(kind)
+                if index is None:
+                    index = self.KINDS[kind]()
+                    index.build(self.phrases() if kind in self.PHRASE_KINDS else self.dfas)
+                    self.built[kind] = index
+        return index
+    
+    def phrases(self):
+        """Pattern keys that are literal phrases, in pattern order"""
+        if self.regexes is None:
+            self.regexes = frozenset(pattern for pattern, data in self.dfas.items() if data.get('syntax') == 'regex')
+        if not self.regexes:
+            return self.dfas
+        return [pattern for pattern in self.dfas if pattern not in self.regexes]
+    
+    def kinds(self):
+        """Kinds built so far; copied under the lock, since another thread may be adding one"""
+        with self.lock:
+            return list(self.built)
+    
+    def warm(self, kinds):
+        """Build the given kinds now, so readers of a new snapshot never pay for them"""
+        for kind in kinds:
+            self.get(kind)
+        return self
+
+class PatternSnapshot:
+    """Immutable published pattern set: compiled base patterns plus a small overlay of learned ones"""
+    
+    def __init__(self, base, union, added=None, indexes=None, version=0):
+        self.base = base               # dict or MappedPatterns, never mutated once published
+        self.added = added or {}       # patterns learned since the base was compiled
+        self.union = union             # UnionDFA over base + added
+        self.indexes = indexes or PatternIndexes(base, union.regex_patterns)   # shared by every snapshot over this base
+        self.overlay_indexes = PatternIndexes(self.added)
+        self.dfas = LayeredPatterns(base, self.added) if self.added else base
+        self.version = version
+    
+    @classmethod
+    def build(cls, dfas, minimize=True, version=0):
+        """Compile a pattern mapping into a fresh snapshot"""
+        union = UnionDFA(minimize)
+        union.build(dfas)
+        return cls(dfas, union, version=version)
+    
+    def with_pattern(self, pattern, data):
+        """New snapshot with one more pattern in the overlay; self stays valid for readers still using it"""
+        added = dict(self.added)
+        added[pattern] = data
+        # The writer builds whatever indexes readers were already using before publishing
+        snapshot = PatternSnapshot(self.base, self.union.with_pattern(pattern, data),
+                                   added, self.indexes, self.version + 1)
+        snapshot.overlay_indexes.warm(self.overlay_indexes.kinds())
+        return snapshot
+    
+    @property
+    def overlay_full(self):
+        """Whether the overlay has grown enough to be worth folding into a new base"""
+        return len(self.added) >= UnionDFA.overlay_limit
+    
+    def with_patterns(self, entries):
+        """New snapshot with the overlay and many more patterns compiled into one base in a single pass"""
+        added = {**self.added, **entries}
+        if isinstance(self.base, MappedPatterns):
+            base = self.base.with_entries(added)
+        else:
+            base = dict(self.base)
+            base.update(added)
+        snapshot = PatternSnapshot.build(base, self.union.minimize, self.version + 1)
+        snapshot.indexes.warm(self.indexes.kinds())
+        return snapshot
+    
+    def index_layers(self, kind):
+        """Index over the base patterns, followed by one over the learned overlay if any"""
+        if not self.added:
+            return [self.indexes.get(kind)]
+        return [self.indexes.get(kind), self.overlay_indexes.get(kind)]
+    
+    def category_counts(self):
+        """Patterns per category across both layers"""
+        counts = Counter()
+        for index in self.index_layers('category'):
+            counts.update(index.counts)
+        return counts
+
+class PatternWatcher:
+    """Daemon thread that polls pattern file mtimes and hot-reloads the engine when they change"""
+    
+    def __init__(self, engine, interval=2.0):
+        self.engine = engine
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+    
+    def start(self):
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, name="pattern-watcher", daemon=True)
+            self.thread.start()
+        return self
+    
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+    
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.poll()
+    
+    def poll(self):
+        """Reload once if any watched file changed since the last load; True if a reload ran"""
+        engine = self.engine
+        # The engine's own journal writes update loaded_signatures under the same lock
+        with engine.write_lock:
+            changed = engine.source_signatures() != engine.loaded_signatures
+        if changed:
+            engine.reload_patterns()
+        return changed
+
+BUILTIN_PATTERNS = {
+    "hi": {
+        "dfa": {
+            "q0": {'h': 'q1'},
+            "q1": {'i': 'q2'},
+            "q2": {}
+        },
+        "accept": "q2",
+        "responses": [
+            "Hello! 👋 Great to see you!",
+            "Hi there! How can I help you today?",
+            "Hey! Welcome to our DFA-powered chat!"
+        ],
+        "category": "greeting",
+        "priority": 1
+    },
+    "hello": {
+        "dfa": {
+            "q0": {'h': 'q1'},
+            "q1": {'e': 'q2'},
+            "q2": {'l': 'q3'},
+            "q3": {'l': 'q4'},
+            "q4": {'o': 'q5'},
+            "q5": {}
+        },
+        "accept": "q5",
+        "responses": [
+            "Hello! 🌟 Nice to meet you!",
+            "Greetings! How are you doing today?",
+            "Hello there! Ready to chat?"
+        ],
+        "category": "greeting",
+        "priority": 1
+    },
+    "how are you": {
+        "dfa": {
+            "q0": {'h': 'q1'},
+            "q1": {'o': 'q2'},
+            "q2": {'w': 'q3'},
+            "q3": {' ': 'q4'},
+            "q4": {'a': 'q5'},
+            "q5": {'r': 'q6'},
+            "q6": {'e': 'q7'},
+            "q7": {' ': 'q8'},
+            "q8": {'y': 'q9'},
+            "q9": {'o': 'q10'},
+            "q10": {'u': 'q11'},
+            "q11": {}
+        },
+        "accept": "q11",
+        "responses": [
+            "I'm functioning perfectly! 🚀 Thanks for asking!",
+            "Doing great! My DFA states are all working smoothly! ⚡",
+            "Excellent! Ready to process your inputs efficiently! 💫",
+            "I'm doing well! How about you?"
+        ],
+        "category": "status",
+        "priority": 2
+    },
+    "what is your name": {
+        "dfa": {
+            "q0": {'w': 'q1'},
+            "q1": {'h': 'q2'},
+            "q2": {'a': 'q3'},
+            "q3": {'t': 'q4'},
+            "q4": {' ': 'q5'},
+            "q5": {'i': 'q6'},
+            "q6": {'s': 'q7'},
+            "q7": {' ': 'q8'},
+            "q8": {'y': 'q9'},
+            "q9": {'o': 'q10'},
+            "q10": {'u': 'q11'},
+            "q11": {'r': 'q12'},
+            "q12": {' ': 'q13'},
+            "q13": {'n': 'q14'},
+            "q14": {'a': 'q15'},
+            "q15": {'m': 'q16'},
+            "q16": {'e': 'q17'},
+            "q17": {}
+        },
+        "accept": "q17",
+        "responses": [
+            "I'm DFA-Bot! 🤖 A chatbot powered by Deterministic Finite Automata!",
+            "You can call me AutomataBot! I speak the language of state machines! ⚙️",
+            "I'm your friendly DFA assistant!"
+        ],
+        "category": "identity",
+        "priority": 2
+    },
+    "good bye": {
+        "dfa": {
+            "q0": {'g': 'q1'},
+            "q1": {'o': 'q2'},
+            "q2": {'o': 'q3'},
+            "q3": {'d': 'q4'},
+            "q4": {' ': 'q5'},
+            "q5": {'b': 'q6'},
+            "q6": {'y': 'q7'},
+            "q7": {'e': 'q8'},
+            "q8": {}
+        },
+        "accept": "q8",
+        "responses": [
+            "Goodbye! 👋 Have an amazing day ahead!",
+            "See you later! Thanks for chatting with me! 🌟",
+            "Farewell! Hope to see you again soon! ✨"
+        ],
+        "category": "farewell",
+        "priority": 1
+    },
+    "tell me a joke": {
+        "dfa": {
+            "q0": {'t': 'q1'},
+            "q1": {'e': 'q2'},
+            "q2": {'l': 'q3'},
+            "q3": {'l': 'q4'},
+            "q4": {' ': 'q5'},
+            "q5": {'m': 'q6'},
+            "q6": {'e': 'q7'},
+            "q7": {' ': 'q8'},
+            "q8": {'a': 'q9'},
+            "q9": {' ': 'q10'},
+            "q10": {'j': 'q11'},
+            "q11": {'o': 'q12'},
+            "q12": {'k': 'q13'},
+            "q13": {'e': 'q14'},
+            "q14": {}
+        },
+        "accept": "q14",
+        "responses": [
+            "Why do programmers prefer dark mode? Because light attracts bugs! 🐛💡",
+            "What do you call a DFA that tells jokes? A Finite State Machine with infinite humor! 😄",
+            "Why did the automaton go to therapy? It had too many state transitions! 🤖💭",
+            "How do you comfort a JavaScript bug? You console it! 😂"
+        ],
+        "category": "entertainment",
+        "priority": 3
+    },
+    "what can you do": {
+        "dfa": {
+            "q0": {'w': 'q1'},
+            "q1": {'h': 'q2'},
+            "q2": {'a': 'q3'},
+            "q3": {'t': 'q4'},
+            "q4": {' ': 'q5'},
+            "q5": {'c': 'q6'},
+            "q6": {'a': 'q7'},
+            "q7": {'n': 'q8'},
+            "q8": {' ': 'q9'},
+            "q9": {'y': 'q10'},
+            "q10": {'o': 'q11'},
+            "q11": {'u': 'q12'},
+            "q12": {' ': 'q13'},
+            "q13": {'d': 'q14'},
+            "q14": {'o': 'q15'},
+            "q15": {}
+        },
+        "accept": "q15",
+        "responses": [
+            "I can understand patterns using DFA! 🎯 I respond to greetings, questions, and more!",
+            "I process text through finite state machines! Try different phrases and watch my DFA traces! ⚡",
+            "I can chat, tell jokes, answer questions, and learn new patterns!"
+        ],
+        "category": "capability",
+        "priority": 2
+    },
+    "good morning": {
+        "dfa": {
+            "q0": {'g': 'q1'},
+            "q1": {'o': 'q2'},
+            "q2": {'o': 'q3'},
+            "q3": {'d': 'q4'},
+            "q4": {' ': 'q5'},
+            "q5": {'m': 'q6'},
+            "q6": {'o': 'q7'},
+            "q7": {'r': 'q8'},
+            "q8": {'n': 'q9'},
+            "q9": {'i': 'q10'},
+            "q10": {'n': 'q11'},
+            "q11": {'g': 'q12'},
+            "q12": {}
+        },
+        "accept": "q12",
+        "responses": [
+            "Good morning to you too! ☀️",
+            "Morning! Hope you have a wonderful day! 🌅",
+            "Good morning! Ready to start the day with some DFA magic? ✨"
+        ],
+        "category": "greeting",
+        "priority": 1
+    },
+    "thank you": {
+        "dfa": {
+            "q0": {'t': 'q1'},
+            "q1": {'h': 'q2'},
+            "q2": {'a': 'q3'},
+            "q3": {'n': 'q4'},
+            "q4": {'k': 'q5'},
+            "q5": {' ': 'q6'},
+            "q6": {'y': 'q7'},
+            "q7": {'o': 'q8'},
+            "q8": {'u': 'q9'},
+            "q9": {}
+        },
+        "accept": "q9",
+        "responses": [
+            "You're welcome! 😊",
+            "My pleasure! Happy to help! 🤗",
+            "Anytime! That's what I'm here for! 💫"
+        ],
+        "category": "politeness",
+        "priority": 2
+    }
+}
+
+DEFAULT_SETTINGS = {
+    'show_traces': True,
+    'fuzzy_matching': True,
+    'learning_mode': True,
+    'auto_save': True,
+    'response_delay': 0.5,
+    'compact_traces': False,
+    'fuzzy_top_k': 32,
+    'match_cache_size': 1024,
+    'history_size': 500,
+    'history_spill': True,
+    'history_gzip': False,
+    'minimize_dfa': True,
+    'keyword_spotting': False,
+    'metrics': False,
+    'hot_reload': False,
+    'reload_interval': 2.0,
+    'export_format': 'txt',
+    'export_patterns': 'full',
+    'export_compression': 'none',
+    'background_export': False,
+    'analytics': True,
+    'analytics_top_k': 50
+}
+
+_builtin_patterns = None
+
+def builtin_patterns():
+    """Built-in patterns with literal DFA chains compacted away, computed once per process"""
+    global _builtin_patterns
+    if _builtin_patterns is None:
+        compacted = {}
+        for pattern, data in BUILTIN_PATTERNS.items():
+            compacted[pattern] = dict(data)
+            DFAChatEngine.compact_pattern(pattern, compacted[pattern])
+        _builtin_patterns = compacted
+    return _builtin_patterns
+
+class DFAChatEngine:
+    """Headless matching engine (match, respond, learn, stats) with no I/O until patterns are used"""
+    
+    # Settings that change which match an input gets, so cached matches depend on them
+    MATCH_SETTINGS = ('keyword_spotting', 'fuzzy_matching', 'fuzzy_top_k')
+    
+    def __init__(self, snapshot_path='custom_patterns.json', journal_path='custom_patterns.journal',
+                 store_path=None, settings=None, history_path=None, notify=None,
+                 pattern_files=(), regex_cache_path=None):
+        self.settings = dict(DEFAULT_SETTINGS)
+        if settings:
+            self.settings.update(settings)
         
         self.stats = {
             'total_messages': 0,
             'matched_messages': 0,
-            'pattern_usage': defaultdict(int),
+            'pattern_usage': PatternUsage(),
             'session_start': datetime.now(),
-            'conversation_history': [],
-            'user_patterns': set()
+            'conversation_history': ConversationHistory(int(self.settings['history_size']), history_path),
+            'user_patterns': set(),
+            'cache_hits': 0,
+            'cache_misses': 0
         }
         
-        self.settings = {
-            'show_traces': True,
-            'fuzzy_matching': True,
-            'learning_mode': True,
-            'auto_save': True,
-            'response_delay': 0.5
+        # Loading messages go through notify; embedded engines stay silent by default
+        self.notify = notify or (lambda message: None)
+        self.store_path = store_path
+        self.store_source_hash = None
+        self.pattern_journal = PatternJournal(snapshot_path, journal_path)
+        self.pattern_files = list(pattern_files)   # extra read-only JSON pattern files
+        self.regex_cache = RegexCache(regex_cache_path)
+        self.unsaved_patterns = []
+        
+        # Hot reload: (mtime, size) of every source as last loaded, plus reload counters
+        self.loaded_signatures = None
+        self.watcher = None
+        self.reload_stats = {
+            'reloads': 0,
+            'failures': 0,
+            'last_duration': 0.0,
+            'last_error': None,
+            'last_reload': None
         }
         
-        self.load_custom_patterns()
-        self.print_welcome()
+        # Readers grab the published snapshot once per call and never lock;
+        # learning and reloading build a new snapshot under write_lock
+        self._snapshot = None
+        self.write_lock = threading.RLock()
+        self.fold_thread = None   # compiles a full overlay into a new base off the write lock
+        self.match_cache = LRUCache(int(self.settings['match_cache_size']))
+        self.metrics = StageMetrics()
+        self.analytics = None   # TrafficAnalytics, created on the first recorded message
     
-    def print_welcome(self):
-        print("=" * 60)
-        print("🤖 ADVANCED DFA CHATBOT SYSTEM")
-        print("=" * 60)
-        print("🚀 Features:")
-        print("   • DFA Pattern Matching with Traces")
-        print("   • Fuzzy String Matching")
-        print("   • Dynamic Pattern Learning")
-        print("   • Conversation Analytics")
-        print("   • Export/Import Capabilities")
-        print("   • Multiple Response Variations")
-        print("-" * 60)
-        print("📋 Commands:")
-        print("   • 'help' - Show all commands")
-        print("   • 'stats' - Show conversation statistics")
-        print("   • 'patterns' - List all patterns")
-        print("   • 'learn' - Enter learning mode")
-        print("   • 'export' - Export conversation")
-        print("   • 'settings' - Modify settings")
-        print("   • 'clear' - Clear conversation history")
-        print("   • 'exit/quit/bye' - End conversation")
-        print("=" * 60)
-        print()
+    @property
+    def pattern_snapshot(self):
+        """Currently published PatternSnapshot; patterns are loaded on first use"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.ensure_loaded()
+            snapshot = self._snapshot
+        return snapshot
+    
+    @property
+    def dfas(self):
+        """Read-only pattern mapping of the current snapshot"""
+        return self.pattern_snapshot.dfas
+    
+    @property
+    def union_dfa(self):
+        return self.pattern_snapshot.union
+    
+    def traffic_analytics(self):
+        """The engine's TrafficAnalytics, creating it if nothing has been recorded yet"""
+        # Its sketches take ~11 KB, so engines that never record traffic don't allocate them
+        if self.analytics is None:
+            with self.write_lock:
+                if self.analytics is None:
+                    self.analytics = TrafficAnalytics(int(self.settings['analytics_top_k']))
+        return self.analytics
+    
+    def publish(self, snapshot):
+        """Make a new snapshot visible to every reader with a single reference swap"""
+        self._snapshot = snapshot
+        if snapshot.overlay_full:
+            self.schedule_fold()
+    
+    def schedule_fold(self):
+        """Start folding the overlay into a new base in the background, unless a fold is running"""
+        with self.write_lock:
+            if self.fold_thread is not None and self.fold_thread.is_alive():
+                return
+            self.fold_thread = threading.Thread(target=self.fold_overlay, name="dfa-overlay-fold", daemon=True)
+            self.fold_thread.start()
+    
+    def fold_overlay(self):
+        """Compile the base plus the learned overlay into a new base until the overlay is small again"""
+        # Learning keeps extending the overlay meanwhile, so learn() does not wait on a full compile
+        while True:
+            started = time.perf_counter()
+            with self.write_lock:
+                previous = self._snapshot
+                if not previous.overlay_full:
+                    return
+            try:
+                snapshot = previous.with_patterns({})
+            except Exception as e:
+                self.notify(f"⚠️  Could not fold learned patterns: {e}")
+                return
+            with self.write_lock:
+                current = self._snapshot
+                if current.base is not previous.base:
+                    # A reload or import replaced the base while we compiled; check its overlay instead
+                    continue
+                # Carry over anything learned while we compiled
+                for pattern, data in current.added.items():
+                    if pattern not in previous.added:
+                        snapshot = snapshot.with_pattern(pattern, data)
+                snapshot.version = current.version + 1
+                self.publish(snapshot)
+            self.metrics.observe('fold', time.perf_counter() - started)
+            self.metrics.count('fold')
+    
+    def load_patterns(self):
+        """Load the built-in patterns plus custom patterns from the configured paths"""
+        self.load_custom_patterns({pattern: dict(data) for pattern, data in builtin_patterns().items()})
+    
+    def ensure_loaded(self):
+        if self._snapshot is None:
+            with self.write_lock:
+                if self._snapshot is None:
+                    self.load_patterns()
+                    if self.settings['hot_reload']:
+                        self.start_watching()
+    
+    def start_watching(self, interval=None):
+        """Poll the pattern sources in a background thread and hot-reload them on change"""
+        if self.watcher is None:
+            interval = self.settings['reload_interval'] if interval is None else interval
+            self.watcher = PatternWatcher(self, float(interval)).start()
+        return self.watcher
+    
+    def stop_watching(self):
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
     
     def run_dfa_with_trace(self, dfa_dict, accept_state, input_str):
         """Enhanced DFA runner with detailed trace"""
@@ -290,7 +2690,7 @@ class AdvancedDFAChatbot:
                     'remaining_input': input_str[i:]
                 }
         
-        accepted = state == accept_state
+        accepted = is_accept_state(state, accept_state)
         trace.append(f"Final: {state} ({'ACCEPT' if accepted else 'REJECT'})")
         
         return {
@@ -309,79 +2709,286 @@ class AdvancedDFAChatbot:
         similarity = SequenceMatcher(None, input_str.lower(), pattern.lower()).ratio()
         return similarity >= threshold
     
-    def find_best_match(self, user_input):
-        """Find the best matching pattern using various techniques"""
+    def find_best_match(self, user_input, stats=None, settings=None, cache=None):
+        """Find the best matching pattern, serving repeated inputs from the match cache"""
+        # Sessions pass their own stats, settings and cache; the console uses the engine's
+        stats = self.stats if stats is None else stats
+        settings = self.settings if settings is None else settings
+        cache = self.match_cache if cache is None else cache
         user_input = user_input.lower().strip()
+        snapshot = self.pattern_snapshot
+        # With instrumentation off every stage costs one `is not None` check
+        metrics = self.metrics if settings['metrics'] else None
+        if metrics is not None:
+            started = time.perf_counter()
         
-        # First try exact DFA matching
-        for pattern, data in self.dfas.items():
-            result = self.run_dfa_with_trace(data["dfa"], data["accept"], user_input)
-            if result['accepted']:
-                return {
-                    'type': 'exact',
+        if settings['match_cache_size'] <= 0:
+            match_result = self.match_input(user_input, settings=settings, stats=stats, snapshot=snapshot)
+        else:
+            # Cached matches are only valid for the snapshot and matching settings they were computed
+            # against, which covers every session's cache and not just the one a setting changed on
+            tag = (snapshot.version, tuple(settings[key] for key in self.MATCH_SETTINGS))
+            if cache.tag != tag:
+                cache.clear()
+                cache.tag = tag
+            # Only the match is cached; responses are still picked per call
+            match_result = cache.get(user_input)
+            if match_result is not None:
+                stats['cache_hits'] += 1
+                if metrics is not None:
+                    metrics.observe_tried(0, 'cached')
+            else:
+                stats['cache_misses'] += 1
+                match_result = self.match_input(user_input, settings=settings, stats=stats, snapshot=snapshot)
+                cache.maxsize = int(settings['match_cache_size'])
+                cache.put(user_input, match_result)
+        
+        if settings['analytics']:
+            self.traffic_analytics().record(user_input, match_result)
+        if metrics is not None:
+            metrics.lap('find_best_match', started)
+        return match_result
+    
+    def match_input(self, user_input, suggest=True, settings=None, stats=None, snapshot=None):
+        """Run the exact → keyword → fuzzy → suggestions pipeline on normalized input"""
+        settings = self.settings if settings is None else settings
+        snapshot = self.pattern_snapshot if snapshot is None else snapshot
+        dfas = snapshot.dfas
+        metrics = self.metrics if settings['metrics'] else None
+        if metrics is not None:
+            mark = time.perf_counter()
+            tried = 1   # the union automaton counts as one pass over every pattern
+        
+        # First try exact matching with a single trace-free pass over the union DFA
+        pattern = snapshot.union.match(user_input)
+        match_result = None
+        if pattern is not None:
+            match_result = {
+                'type': 'exact',
+                'pattern': pattern,
+                'data': dfas[pattern],
+                'result': {'accepted': True, 'final_state': self.get_accept_state(pattern, dfas, user_input)},
+                'confidence': 1.0
+            }
+        if metrics is not None:
+            mark = metrics.lap('exact', mark)
+        
+        # Optionally look for known phrases anywhere in the message
+        if match_result is None and settings['keyword_spotting']:
+            match_result = self.keyword_match(user_input, snapshot)
+            if metrics is not None:
+                mark = metrics.lap('keyword', mark)
+                tried += len(match_result['result']['matches']) if match_result else 0
+        
+        # Then try fuzzy matching
+        if match_result is None and settings['fuzzy_matching']:
+            # Only the bigram index's top candidates are scored with SequenceMatcher
+            indexes = snapshot.index_layers('fuzzy')
+            top_k = int(settings['fuzzy_top_k'])
+            candidates = [index.candidates(user_input, 0.75, top_k) for index in indexes]
+            if metrics is not None:
+                mark = metrics.lap('fuzzy_candidates', mark)
+                tried += sum(len(ids) for ids in candidates)
+            best = None
+            for index, ids in zip(indexes, candidates):
+                scored = index.score(user_input, ids, 0.75)
+                if scored and (best is None or scored[0][0] > best[0]):
+                    best = scored[0]
+            if metrics is not None:
+                mark = metrics.lap('fuzzy_score', mark)
+            if best is not None:
+                similarity, pattern = best
+                match_result = {
+                    'type': 'fuzzy',
                     'pattern': pattern,
-                    'data': data,
-                    'result': result,
-                    'confidence': 1.0
+                    'data': dfas[pattern],
+                    'result': {'accepted': False, 'similarity': similarity},
+                    'confidence': similarity
                 }
         
-        # Then try fuzzy matching
-        if self.settings['fuzzy_matching']:
-            best_fuzzy = None
-            best_similarity = 0
-            
-            for pattern, data in self.dfas.items():
-                similarity = SequenceMatcher(None, user_input, pattern).ratio()
-                if similarity > best_similarity and similarity >= 0.75:
-                    best_similarity = similarity
-                    best_fuzzy = {
-                        'type': 'fuzzy',
-                        'pattern': pattern,
-                        'data': data,
-                        'result': {'trace': [f"Fuzzy match: '{pattern}' (similarity: {similarity:.2%})"]},
-                        'confidence': similarity
-                    }
-            
-            if best_fuzzy:
-                return best_fuzzy
+        # Check for partial matches or suggestions
+        if match_result is None:
+            usage = (self.stats if stats is None else stats)['pattern_usage']
+            suggestions = self.get_suggestions(user_input, usage=usage, snapshot=snapshot) if suggest else []
+            if metrics is not None and suggest:
+                mark = metrics.lap('suggestions', mark)
+                tried += len(suggestions)
+            match_result = {
+                'type': 'no_match',
+                'suggestions': suggestions,
+                'confidence': 0.0
+            }
+        
+        if metrics is not None:
+            metrics.observe_tried(tried, match_result['type'])
+        return match_result
+    
+    def stream_matcher(self):
+        """Incremental matcher over the current patterns, for keystrokes or partial transcripts"""
+        return StreamMatcher(self.pattern_snapshot.union)
+    
+    def keyword_match(self, user_input, snapshot=None):
+        """Aho-Corasick scan for embedded phrases; the best `priority` wins"""
+        snapshot = self.pattern_snapshot if snapshot is None else snapshot
+        dfas = snapshot.dfas
+        hits = [hit for index in snapshot.index_layers('keyword') for hit in index.search(user_input)]
+        if not hits:
+            return None
         
-        # Check for partial matches or suggestions
-        suggestions = self.get_suggestions(user_input)
+        # Lower priority numbers win, then longer phrases, then earlier occurrences
+        start, pattern = min(hits, key=lambda hit: (dfas[hit[1]].get('priority', 3),
+                                                   -len(hit[1]), hit[0]))
+        return {
+            'type': 'keyword',
+            'pattern': pattern,
+            'data': dfas[pattern],
+            'result': {'accepted': True, 'span': (start, start + len(pattern)),
+                       'matches': sorted({hit[1] for hit in hits})},
+            'confidence': len(pattern) / len(user_input)
+        }
+    
+    def classify(self, user_input):
+        """Side-effect-free classification of one message (no stats, cache or output)"""
+        match_result = self.match_input(user_input.lower().strip(), suggest=False)
         return {
-            'type': 'no_match',
-            'suggestions': suggestions,
-            'confidence': 0.0
+            'input': user_input,
+            'pattern': match_result.get('pattern'),
+            'type': match_result['type'],
+            'confidence': match_result['confidence']
         }
     
-    def get_suggestions(self, user_input):
-        """Get pattern suggestions based on partial matches"""
-        suggestions = []
-        user_input = user_input.lower()
+    def classify_batch(self, user_inputs):
+        """classify() for a list of messages, with all fuzzy lookups scored as one batch"""
+        snapshot = self.pattern_snapshot
+        normalized = [user_input.lower().strip() for user_input in user_inputs]
+        settings = dict(self.settings, fuzzy_matching=False)
+        results = [self.match_input(text, suggest=False, settings=settings, snapshot=snapshot)
+                   for text in normalized]
         
-        for pattern in self.dfas.keys():
-            if pattern.startswith(user_input[:3]) or user_input[:3] in pattern:
-                suggestions.append(pattern)
+        if self.settings['fuzzy_matching']:
+            misses = [i for i, result in enumerate(results) if result['type'] == 'no_match']
+            for i, best in zip(misses, self.fuzzy_match_many([normalized[i] for i in misses], snapshot)):
+                if best is not None:
+                    results[i] = {'type': 'fuzzy', 'pattern': best[1], 'confidence': best[0]}
         
-        return suggestions[:3]
+        return [{
+            'input': user_input,
+            'pattern': result.get('pattern'),
+            'type': result['type'],
+            'confidence': result['confidence']
+        } for user_input, result in zip(user_inputs, results)]
     
-    def generate_response(self, match_result, user_input):
-        """Generate contextual response based on match result"""
+    def fuzzy_match_many(self, user_inputs, snapshot=None, threshold=0.75):
+        """Best (similarity, pattern) per normalized input, or None, using vectorized block scoring"""
+        snapshot = self.pattern_snapshot if snapshot is None else snapshot
+        top_k = int(self.settings['fuzzy_top_k'])
+        best = [None] * len(user_inputs)
+        # Layers are scored like match_input: the best similarity wins, ties go to the base
+        for index in snapshot.index_layers('fuzzy'):
+            for i, result in enumerate(index.batch_scorer().best_matches(user_inputs, threshold, top_k)):
+                if result is not None and (best[i] is None or result[0] > best[i][0]):
+                    best[i] = result
+        return best
+    
+    def classify_many(self, inputs, workers=1, chunksize=256):
+        """Classify an iterable of messages, yielding results in input order"""
+        self.ensure_loaded()
+        iterator = iter(inputs)
+        chunks = iter(lambda: list(islice(iterator, chunksize)), [])
+        
+        if workers > 1:
+            # Imported here so embedding the engine doesn't pay for multiprocessing
+            import multiprocessing
+            # Spawned workers would need a pickled engine (locks, notify callbacks), so
+            # without fork (Windows, spawn-only macOS) the batches run in this process
+            if 'fork' not in multiprocessing.get_all_start_methods():
+                workers = 1
+        
+        if workers <= 1:
+            for chunk in chunks:
+                yield from self.classify_batch(chunk)
+            return
+        
+        # Workers inherit the indexes on fork, so build them once here rather than per worker
+        if self.settings['fuzzy_matching']:
+            for index in self.pattern_snapshot.index_layers('fuzzy'):
+                index.batch_scorer()
+        
+        from concurrent.futures import ProcessPoolExecutor
+        
+        # Each worker inherits this engine on fork and reuses its compiled
+        # automaton and indexes; a bounded window keeps input streaming
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_batch_worker, initargs=(self,)) as pool:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(_classify_chunk, chunk))
+                if len(pending) >= workers * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+    
+    def get_trace(self, match_result, user_input):
+        """Build the human-readable trace for the chosen pattern only"""
         if match_result['type'] == 'exact':
+            dfa, accept_state = self.get_pattern_dfa(match_result['pattern'], match_result['data'])
+            return self.run_dfa_with_trace(dfa, accept_state, user_input.lower().strip())['trace']
+        if match_result['type'] == 'keyword':
+            start, end = match_result['result']['span']
+            dfa, accept_state = self.get_pattern_dfa(match_result['pattern'], match_result['data'])
+            phrase = user_input.lower().strip()[start:end]
+            return ([f"Keyword match: '{match_result['pattern']}' at {start}-{end}"]
+                    + self.run_dfa_with_trace(dfa, accept_state, phrase)['trace'])
+        if match_result['type'] == 'fuzzy':
+            similarity = match_result['result']['similarity']
+            return [f"Fuzzy match: '{match_result['pattern']}' (similarity: {similarity:.2%})"]
+        return ["No matching DFA pattern found"]
+    
+    def get_trace_states(self, pattern, user_input):
+        """Compact trace of an accepted input: the visited state ids as an int array"""
+        dfa, _ = self.get_pattern_dfa(pattern)
+        state_ids = {state: i for i, state in enumerate(dfa)}
+        state = "q0"
+        states = array('i', [state_ids[state]])
+        for ch in user_input.lower().strip():
+            state = dfa[state][ch]
+            states.append(state_ids[state])
+        return states
+    
+    def format_trace_states(self, pattern, states):
+        """Expand a compact state-id trace back into readable form"""
+        names = list(self.get_pattern_dfa(pattern)[0])
+        return [names[i] for i in states]
+    
+    def get_suggestions(self, user_input, limit=3, usage=None, snapshot=None):
+        """Patterns sharing the input's first three characters, most used first"""
+        snapshot = self.pattern_snapshot if snapshot is None else snapshot
+        usage = self.stats['pattern_usage'] if usage is None else usage
+        return SuggestionIndex.suggest_across(snapshot.index_layers('suggestion'),
+                                              user_input.lower()[:3], usage, limit)
+    
+    def generate_response(self, match_result, user_input, stats=None, settings=None):
+        """Generate contextual response based on match result"""
+        # Sessions pass their own stats/settings; the console uses the bot's
+        stats = self.stats if stats is None else stats
+        settings = self.settings if settings is None else settings
+        metrics = self.metrics if settings['metrics'] else None
+        if metrics is not None:
+            mark = time.perf_counter()
+        
+        if match_result['type'] in ('exact', 'keyword'):
             responses = match_result['data']['responses']
             response = random.choice(responses)
             
             # Update usage statistics
-            self.stats['pattern_usage'][match_result['pattern']] += 1
-            self.stats['matched_messages'] += 1
-            
-            return response, match_result['result']['trace']
+            stats['pattern_usage'][match_result['pattern']] += 1
+            stats['matched_messages'] += 1
             
         elif match_result['type'] == 'fuzzy':
             responses = match_result['data']['responses']
             response = f"I think you meant: {random.choice(responses)}"
-            self.stats['matched_messages'] += 1
-            
-            return response, match_result['result']['trace']
+            stats['matched_messages'] += 1
             
         else:
             # No match found
@@ -396,8 +3003,572 @@ class AdvancedDFAChatbot:
             
             if match_result.get('suggestions'):
                 response += f"\n💡 Maybe try: {', '.join(match_result['suggestions'])}"
+        
+        if metrics is not None:
+            mark = metrics.lap('response', mark)
+        
+        # Traces are only rendered when someone is going to look at them
+        trace = self.get_trace(match_result, user_input) if settings['show_traces'] else []
+        if metrics is not None and settings['show_traces']:
+            metrics.lap('trace', mark)
+        return response, trace
+    
+    def respond(self, message):
+        """Answer one message, updating this engine's stats and history; returns (response, trace)"""
+        self.stats['total_messages'] += 1
+        match_result = self.find_best_match(message)
+        response, trace = self.generate_response(match_result, message)
+        
+        self.stats['conversation_history'].append({
+            'timestamp': time.time(),
+            'sender': 'User',
+            'message': message
+        })
+        bot_entry = {
+            'timestamp': time.time(),
+            'sender': 'Bot',
+            'message': response,
+            'trace': trace if self.settings['show_traces'] else []
+        }
+        if bot_entry['trace'] and self.settings['compact_traces'] and match_result['type'] == 'exact':
+            bot_entry['trace'] = self.get_trace_states(match_result['pattern'], message)
+            bot_entry['trace_pattern'] = match_result['pattern']
+        self.stats['conversation_history'].append(bot_entry)
+        
+        return response, trace
+    
+    def learn(self, pattern, response, category="custom", priority=3, save=None):
+        """Add a literal pattern with one response; returns False if it exists or a regex already answers it"""
+        pattern = pattern.strip().lower()
+        self.ensure_loaded()
+        fold = self.fold_thread
+        if fold is not None and len(self._snapshot.added) >= UnionDFA.overlay_cap:
+            # Every learn copies the overlay, so past the cap it waits for the running fold
+            fold.join()
+        with self.write_lock:
+            snapshot = self._snapshot
+            if not pattern or pattern in snapshot.dfas:
+                return False
+            # The overlay is only consulted after the regex automaton, so this phrase could never match
+            regex = snapshot.union.regex_match(pattern)
+            if regex is not None:
+                self.notify(f"⚠️  '{pattern}' is already answered by the regex pattern '{regex}'")
+                return False
+            
+            # Literal patterns need no stored DFA; it is regenerated on demand.
+            # Readers keep the old snapshot until the new one is published.
+            self.publish(snapshot.with_pattern(pattern, {
+                "responses": [response],
+                "category": category,
+                "priority": priority,
+                "learned": True,
+                "timestamp": datetime.now().isoformat()
+            }))
+            self.unsaved_patterns.append(pattern)
+            
+            # save=None follows auto_save; callers batching several patterns pass save=False
+            if self.settings['auto_save'] if save is None else save:
+                self.save_custom_patterns()
+        return True
+    
+    def summary(self):
+        """Headline statistics as a plain dict"""
+        total = self.stats['total_messages']
+        matched = self.stats['matched_messages']
+        return {
+            'total_messages': total,
+            'matched_messages': matched,
+            'success_rate': (matched / total) if total > 0 else 0.0,
+            'patterns': len(self.dfas),
+            'cache_hits': self.stats['cache_hits'],
+            'cache_misses': self.stats['cache_misses']
+        }
+    
+    @staticmethod
+    def generate_dfa(pattern):
+        """Generate DFA states for a given pattern"""
+        states = {}
+        current_state = "q0"
+        
+        states[current_state] = {}
+        
+        for i, char in enumerate(pattern):
+            next_state = f"q{i + 1}"
+            states[current_state][char] = next_state
+            states[next_state] = {}
+            current_state = next_state
+        
+        return {
+            'states': states,
+            'accept_state': current_state
+        }
+    
+    def rebuild_indexes(self, dfas=None):
+        """Compile all patterns (or the given mapping) into a fresh snapshot and publish it"""
+        with self.write_lock:
+            dfas = self.dfas if dfas is None else dfas
+            version = self._snapshot.version + 1 if self._snapshot is not None else 0
+            snapshot = PatternSnapshot.build(dfas, self.settings['minimize_dfa'], version)
+            # Fuzzy lookups are on by default, so build that index before anyone waits on it
+            snapshot.indexes.warm(['fuzzy'] if self.settings['fuzzy_matching'] else [])
+            self.publish(snapshot)
+    
+    def get_pattern_dfa(self, pattern, data=None):
+        """Return (dfa dict, accept state) for a pattern, regenerating literal chains"""
+        data = self.dfas[pattern] if data is None else data
+        if "dfa" in data:
+            return data["dfa"], data["accept"]
+        dfa_states = self.generate_dfa(pattern)
+        return dfa_states['states'], dfa_states['accept_state']
+    
+    @staticmethod
+    def compact_pattern(pattern, data):
+        """Drop a stored DFA dict when it is just the literal chain for the pattern"""
+        if "dfa" not in data:
+            return
+        dfa_states = DFAChatEngine.generate_dfa(pattern)
+        if data["dfa"] == dfa_states['states'] and data["accept"] == dfa_states['accept_state']:
+            del data["dfa"]
+            del data["accept"]
+    
+    def export_pattern(self, pattern, data=None, compact=False):
+        """Pattern entry in the JSON authoring format, with its DFA dict filled in"""
+        data = self.dfas[pattern] if data is None else data
+        if compact:
+            # Literal chains were compacted away on load and are regenerated on import;
+            # only hand-authored DFAs are still stored in the entry
+            if data.get("syntax") == "regex":
+                return {k: v for k, v in data.items() if k not in ("dfa", "accept")}
+            return data
+        dfa, accept_state = self.get_pattern_dfa(pattern, data)
+        return {"dfa": dfa, "accept": accept_state, **data}
+    
+    def get_accept_state(self, pattern, dfas=None, text=""):
+        """Accept state name of a pattern without materializing its DFA"""
+        data = (self.dfas if dfas is None else dfas)[pattern]
+        accept = data.get("accept", f"q{len(pattern)}")
+        if not isinstance(accept, list):
+            return accept
+        # Regex patterns have several accept states; the accepted text decides which one
+        state = "q0"
+        for ch in text:
+            state = data["dfa"][state][ch]
+        return state
+    
+    def save_custom_patterns(self):
+        """Journal newly learned patterns, compacting the snapshot once the journal is long"""
+        with self.write_lock:
+            dfas = self.dfas
+            saved = len(self.unsaved_patterns)
+            # A batch that would fill the journal anyway (an import) goes straight into the snapshot
+            if self.pattern_journal.records + saved < self.pattern_journal.compact_every:
+                for pattern in self.unsaved_patterns:
+                    self.pattern_journal.append(pattern, dfas[pattern])
+            else:
+                self.pattern_journal.records += saved
+            self.unsaved_patterns.clear()
+            
+            if self.pattern_journal.needs_compaction():
+                # Literal chains are regenerated on load, so only hand-authored DFAs are written
+                custom_patterns = {k: self.export_pattern(k, v, compact=True) for k, v in dfas.items()
+                                   if v.get('learned')}
+                self.pattern_journal.compact(custom_patterns)
+                self.notify(f"🗜️  Compacted {len(custom_patterns)} custom patterns into {self.pattern_journal.snapshot_path}")
+            
+            # Our own writes are already live, so the watcher must not reload them
+            if saved and self.loaded_signatures is not None:
+                self.loaded_signatures = self.source_signatures()
+        
+        if saved:
+            self.notify(f"💾 Saved {saved} custom patterns")
+    
+    def load_custom_patterns(self, dfas=None):
+        """Load custom patterns from the compiled store, or from snapshot plus journal"""
+        store_path = self.store_path
+        self.loaded_signatures = self.source_signatures()
+        source_hash = self.pattern_source_hash() if store_path else None
+        self.store_source_hash = source_hash
+        
+        if store_path:
+            try:
+                store = PatternStore.open(store_path, source_hash, self.settings['minimize_dfa'])
+            except (OSError, ValueError, TypeError, struct.error) as e:
+                self.notify(f"⚠️  Could not open pattern store: {e}")
+                store = None
+            if store is not None:
+                # Entries are decoded lazily and the indexes wait for their first lookup
+                mapped, union = store
+                version = self._snapshot.version + 1 if self._snapshot is not None else 0
+                self.publish(PatternSnapshot(mapped, union, version=version))
+                self.pattern_journal.records = self.pattern_journal.load_record_count()
+                self.notify(f"📂 Loaded {len(mapped)} patterns from {store_path}")
+                return
+        
+        self.rebuild_indexes(self.read_patterns(dfas))
+        
+        # Loading may have cut a torn journal tail, so tag the store with the bytes as they are now
+        signatures = self.source_signatures()
+        if signatures != self.loaded_signatures:
+            self.loaded_signatures = signatures
+            source_hash = self.pattern_source_hash() if store_path else None
+            self.store_source_hash = source_hash
+        
+        if store_path:
+            self.compile_pattern_store(store_path, source_hash)
+    
+    def read_patterns(self, dfas=None, strict=False):
+        """Built-ins, then extra pattern files, then the custom snapshot and journal, as one dict"""
+        # Lenient loading skips a bad source with a notice; strict loading (reloads) raises
+        if dfas is None:
+            dfas = {pattern: dict(data) for pattern, data in builtin_patterns().items()}
+        for path in self.pattern_files:
+            try:
+                patterns = self.validate_patterns(self.read_pattern_file(path), path, self.regex_cache)
+                dfas.update(patterns)
+                self.notify(f"📂 Loaded {len(patterns)} patterns from {path}")
+            except (OSError, ValueError) as e:
+                if strict:
+                    raise ValueError(f"{path}: {e}") from e
+                self.notify(f"⚠️  Could not load pattern file {path}: {e}")
+        
+        try:
+            custom_patterns, skipped = self.pattern_journal.load()
+            if skipped:
+                self.notify(f"⚠️  Skipped {skipped} corrupted journal record(s)")
+            if custom_patterns:
+                dfas.update(self.validate_patterns(custom_patterns, self.pattern_journal.snapshot_path,
+                                                   self.regex_cache))
+                self.notify(f"📂 Loaded {len(custom_patterns)} custom patterns")
+        except Exception as e:
+            if strict:
+                raise
+            self.notify(f"⚠️  Could not load custom patterns: {e}")
+        
+        try:
+            self.regex_cache.save()
+        except OSError as e:
+            self.notify(f"⚠️  Could not write regex cache: {e}")
+        return dfas
+    
+    @staticmethod
+    def read_pattern_file(path):
+        """{phrase: entry} from a JSON object file or a JSONL pattern export, optionally compressed"""
+        with ExportFile.open_text(path) as f:
+            if not path.replace('.gz', '').replace('.zst', '').endswith('.jsonl'):
+                return json.load(f)
+            patterns = {}
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if not isinstance(record, dict) or not isinstance(record.get('pattern'), str):
+                    raise ValueError(f"line {number}: expected an object with a 'pattern' string")
+                patterns[record.pop('pattern')] = record
+            return patterns
+    
+    @classmethod
+    def validate_patterns(cls, patterns, source, regex_cache=None):
+        """Check a {phrase: entry} mapping read from disk, compile regex entries and compact literal DFAs"""
+        if not isinstance(patterns, dict):
+            raise ValueError(f"{source}: expected a JSON object mapping phrases to entries")
+        regex_cache = regex_cache or RegexCache()
+        for pattern, data in patterns.items():
+            if not isinstance(data, dict) or not isinstance(data.get('responses'), list) or not data['responses']:
+                raise ValueError(f"{source}: pattern '{pattern}' needs a non-empty 'responses' list")
+            if data.get('syntax') == 'regex':
+                # The source is authoritative: any stored DFA is replaced by the (cached) compilation
+                try:
+                    data['dfa'], data['accept'] = regex_cache.compile(pattern)
+                except ValueError as e:
+                    raise ValueError(f"{source}: {e}") from None
+                continue
+            if 'dfa' in data and 'accept' not in data:
+                raise ValueError(f"{source}: pattern '{pattern}' has a 'dfa' without an 'accept' state")
+            cls.compact_pattern(pattern, data)
+        return patterns
+    
+    IMPORT_COLUMNS = {'phrase': ('phrase', 'pattern'), 'responses': ('responses', 'response')}
+    
+    @staticmethod
+    def read_import_rows(path, format=None):
+        """Stream (line number, record dict) from a CSV or JSONL import file, optionally compressed"""
+        if format is None:
+            format = 'csv' if path.replace('.gz', '').replace('.zst', '').endswith('.csv') else 'jsonl'
+        if format == 'csv':
+            import csv
+            with ExportFile.open_text(path, newline='') as f:
+                reader = csv.DictReader(f)
+                for record in reader:
+                    # line_num is the last physical line read, which only differs for quoted newlines
+                    yield reader.line_num, record
+        elif format == 'jsonl':
+            with ExportFile.open_text(path) as f:
+                for number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield number, json.loads(line)
+                    except ValueError as e:
+                        yield number, f"invalid JSON: {e}"
+        else:
+            raise ValueError(f"unknown import format '{format}' (expected csv or jsonl)")
+    
+    @classmethod
+    def import_entry(cls, record):
+        """(phrase, responses, category, priority) from one import record; ValueError names the bad field"""
+        if not isinstance(record, dict):
+            raise ValueError(record if isinstance(record, str) else "expected an object")
+        values = {}
+        for field, names in cls.IMPORT_COLUMNS.items():
+            values[field] = next((record[name] for name in names if record.get(name) not in (None, '')), None)
+        
+        phrase = values['phrase']
+        if not isinstance(phrase, str) or not phrase.strip():
+            raise ValueError("missing phrase")
+        responses = values['responses']
+        if isinstance(responses, str):
+            # CSV cells hold several responses separated by '|'
+            responses = responses.split('|')
+        if not isinstance(responses, list) or not all(isinstance(r, str) for r in responses):
+            raise ValueError("responses must be a string or a list of strings")
+        responses = [r.strip() for r in responses if r.strip()]
+        if not responses:
+            raise ValueError("missing response")
+        category = record.get('category') or "custom"
+        if not isinstance(category, str):
+            raise ValueError("category must be a string")
+        try:
+            priority = int(record.get('priority') or 3)
+        except (TypeError, ValueError):
+            raise ValueError(f"priority '{record.get('priority')}' is not an integer") from None
+        return phrase.strip().lower(), responses, category.strip(), priority
+    
+    def import_patterns(self, path, format=None, max_rejected=20):
+        """Bulk-load phrases from a CSV or JSONL file, compiling every index in one pass; returns a report"""
+        self.ensure_loaded()
+        started = time.perf_counter()
+        existing = self.pattern_snapshot.dfas
+        timestamp = datetime.now().isoformat()
+        entries = {}
+        report = {'source': path, 'rows': 0, 'imported': 0, 'merged': 0, 'duplicates': 0,
+                  'rejected': 0, 'rejected_rows': []}
+        
+        # Rows are streamed and merged by phrase; nothing is compiled until the whole file is read
+        for number, record in self.read_import_rows(path, format):
+            report['rows'] += 1
+            try:
+                phrase, responses, category, priority = self.import_entry(record)
+            except ValueError as e:
+                report['rejected'] += 1
+                if len(report['rejected_rows']) < max_rejected:
+                    report['rejected_rows'].append((number, str(e)))
+                continue
+            if phrase in existing:
+                report['duplicates'] += 1
+                continue
+            entry = entries.get(phrase)
+            if entry is None:
+                entries[phrase] = {"responses": responses, "category": category, "priority": priority,
+                                   "learned": True, "timestamp": timestamp}
+                continue
+            # A repeated phrase adds its new responses; the first row's category and priority win
+            new = [r for r in responses if r not in entry["responses"]]
+            if new:
+                entry["responses"].extend(new)
+                report['merged'] += 1
+            else:
+                report['duplicates'] += 1
+        report['imported'] = len(entries)
+        report['read_seconds'] = time.perf_counter() - started
+        
+        if entries:
+            with self.write_lock:
+                previous = self._snapshot
+            # One compile for the whole batch, off the lock, like a reload
+            compiled_at = time.perf_counter()
+            snapshot = previous.with_patterns(entries)
+            report['compile_seconds'] = time.perf_counter() - compiled_at
+            with self.write_lock:
+                current = self._snapshot
+                if current is not previous:
+                    # Carry over anything learned while we compiled
+                    for pattern in current.dfas:
+                        if pattern not in previous.dfas and pattern not in snapshot.dfas:
+                            snapshot = snapshot.with_pattern(pattern, current.dfas[pattern])
+                snapshot.version = current.version + 1
+                self.publish(snapshot)
+                self.unsaved_patterns.extend(entries)
+                
+                if self.settings['auto_save']:
+                    saved_at = time.perf_counter()
+                    self.save_custom_patterns()
+                    if self.store_path:
+                        self.store_source_hash = self.pattern_source_hash()
+                        self.compile_pattern_store(self.store_path, self.store_source_hash)
+                    report['save_seconds'] = time.perf_counter() - saved_at
+        
+        duration = time.perf_counter() - started
+        report['seconds'] = duration
+        report['rows_per_second'] = report['rows'] / duration if duration > 0 else 0.0
+        self.metrics.observe('import', duration)
+        self.metrics.count('import')
+        return report
+    
+    def source_signatures(self):
+        """(path, mtime, size) of every pattern source; missing files show up as None"""
+        signatures = []
+        for path in (self.pattern_journal.snapshot_path, self.pattern_journal.journal_path, *self.pattern_files):
+            try:
+                stat = os.stat(path)
+                signatures.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signatures.append((path, None, None))
+        return signatures
+    
+    def reload_patterns(self):
+        """Re-read every pattern source and atomically swap in a fresh snapshot; True on success"""
+        started = time.perf_counter()
+        with self.write_lock:
+            # Reading happens under the lock so a concurrent journal append is never half-seen
+            signatures = self.source_signatures()
+            previous = self._snapshot
+            carried = list(self.unsaved_patterns)
+            try:
+                dfas = self.read_patterns(strict=True)
+                source_hash = self.pattern_source_hash() if self.store_path else None
+            except Exception as e:
+                return self.reload_failed(signatures, started, e)
+        
+        # Compiling is the slow part: readers keep serving the old snapshot meanwhile
+        try:
+            snapshot = PatternSnapshot.build(dfas, self.settings['minimize_dfa'])
+            snapshot.indexes.warm(previous.indexes.kinds() if previous is not None else ['fuzzy'])
+        except Exception as e:
+            with self.write_lock:
+                return self.reload_failed(signatures, started, e)
+        if self.store_path:
+            try:
+                PatternStore.write(self.store_path, dfas, snapshot.union, source_hash)
+                self.store_source_hash = source_hash
+            except OSError as e:
+                self.notify(f"⚠️  Could not write pattern store: {e}")
+        
+        with self.write_lock:
+            current = self._snapshot
+            # Unsaved patterns and anything learned while we compiled must survive the swap
+            if previous is not None and current is not previous:
+                carried += [pattern for pattern in current.dfas if pattern not in previous.dfas]
+            for pattern in carried:
+                if current is not None and pattern in current.dfas and pattern not in snapshot.dfas:
+                    snapshot = snapshot.with_pattern(pattern, current.dfas[pattern])
+            snapshot.version = current.version + 1 if current is not None else 0
+            self.publish(snapshot)
+            self.loaded_signatures = signatures
             
-            return response, ["No matching DFA pattern found"]
+            duration = time.perf_counter() - started
+            self.reload_stats.update(reloads=self.reload_stats['reloads'] + 1, last_duration=duration,
+                                     last_error=None, last_reload=datetime.now())
+            self.metrics.observe('reload', duration)
+            self.metrics.count('reload')
+        self.notify(f"🔄 Reloaded {len(snapshot.dfas)} patterns in {duration:.2f}s")
+        return True
+    
+    def reload_failed(self, signatures, started, error):
+        """Count a failed reload; the previous snapshot keeps serving"""
+        # Remember the bad version so it is reported once, not on every poll
+        self.loaded_signatures = signatures
+        duration = time.perf_counter() - started
+        self.reload_stats.update(failures=self.reload_stats['failures'] + 1, last_duration=duration,
+                                 last_error=str(error))
+        self.metrics.observe('reload_failed', duration)
+        self.metrics.count('reload_failure')
+        self.notify(f"⚠️  Reload failed, keeping the previous patterns: {error}")
+        return False
+    
+    def pattern_source_hash(self):
+        """Hash of the built-in patterns plus the custom pattern snapshot, journal and pattern file bytes"""
+        digest = hashlib.sha256(f"{PatternStore.MAGIC}{PatternStore.VERSION}".encode())
+        digest.update(json.dumps(builtin_patterns(), sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+        for path in (self.pattern_journal.snapshot_path, self.pattern_journal.journal_path, *self.pattern_files):
+            digest.update(path.encode('utf-8'))
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(chunk)
+        return digest.digest()
+    
+    def compile_pattern_store(self, store_path, source_hash):
+        """Write the current pattern set and compiled tables to the binary store"""
+        snapshot = self.pattern_snapshot
+        if snapshot.added:
+            # The store holds compiled tables only, so fold learned patterns in first
+            self.rebuild_indexes()
+            snapshot = self.pattern_snapshot
+        try:
+            PatternStore.write(store_path, snapshot.dfas, snapshot.union, source_hash)
+        except OSError as e:
+            self.notify(f"⚠️  Could not write pattern store: {e}")
+
+class AdvancedDFAChatbot:
+    """Interactive console front end over a DFAChatEngine"""
+    
+    def __init__(self, engine=None, **engine_options):
+        self.engine = engine if engine is not None else DFAChatEngine(notify=print, **engine_options)
+        if engine is None:
+            self.stats['conversation_history'] = self.new_history()
+        self.export_threads = []
+        self.engine.ensure_loaded()
+        self.print_welcome()
+    
+    def __getattr__(self, name):
+        # dfas, stats, settings and the matching API all live on the engine
+        if name == 'engine':
+            raise AttributeError(name)
+        return getattr(self.engine, name)
+    
+    def new_history(self, previous=None):
+        """Conversation history laid out by the current history_* settings, continuing a previous one"""
+        # Recent messages stay in memory; the full log streams to a JSONL spill file
+        spill_path = None
+        if self.settings['history_spill']:
+            spill_path = f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+            if self.settings['history_gzip']:
+                spill_path += ".gz"
+        if previous is not None and spill_path == previous.spill_path:
+            return previous
+        history = ConversationHistory(int(self.settings['history_size']), spill_path)
+        if previous is not None:
+            for entry in previous:
+                history.append(entry)
+            previous.clear()
+        return history
+    
+    def print_welcome(self):
+        print("=" * 60)
+        print("🤖 ADVANCED DFA CHATBOT SYSTEM")
+        print("=" * 60)
+        print("🚀 Features:")
+        print("   • DFA Pattern Matching with Traces")
+        print("   • Fuzzy String Matching")
+        print("   • Dynamic Pattern Learning")
+        print("   • Conversation Analytics")
+        print("   • Export/Import Capabilities")
+        print("   • Multiple Response Variations")
+        print("-" * 60)
+        print("📋 Commands:")
+        print("   • 'help' - Show all commands")
+        print("   • 'stats' - Show conversation statistics")
+        print("   • 'patterns' - List all patterns")
+        print("   • 'learn' - Enter learning mode")
+        print("   • 'export' - Export conversation")
+        print("   • 'import <file>' - Bulk import patterns from CSV/JSONL")
+        print("   • 'metrics' - Export stage latency metrics")
+        print("   • 'unmatched' - Most frequent unmatched inputs")
+        print("   • 'settings' - Modify settings")
+        print("   • 'clear' - Clear conversation history")
+        print("   • 'exit/quit/bye' - End conversation")
+        print("=" * 60)
+        print()
     
     def learn_new_pattern(self):
         """Interactive pattern learning system"""
@@ -418,6 +3589,11 @@ class AdvancedDFAChatbot:
                 print(f"❌ Pattern '{pattern}' already exists!")
                 continue
             
+            regex = self.engine.union_dfa.regex_match(pattern)
+            if regex is not None:
+                print(f"❌ '{pattern}' is already answered by the regex pattern '{regex}'!")
+                continue
+            
             response = input("Enter response: ").strip()
             if not response:
                 print("❌ Please enter a valid response!")
@@ -425,18 +3601,8 @@ class AdvancedDFAChatbot:
             
             category = input("Enter category (optional): ").strip() or "custom"
             
-            # Generate DFA for new pattern
-            dfa_states = self.generate_dfa(pattern)
-            
-            self.dfas[pattern] = {
-                "dfa": dfa_states['states'],
-                "accept": dfa_states['accept_state'],
-                "responses": [response],
-                "category": category,
-                "priority": 3,
-                "learned": True,
-                "timestamp": datetime.now().isoformat()
-            }
+            # Saving is batched until the end of the learning session
+            self.engine.learn(pattern, response, category, save=False)
             
             print(f"✅ Successfully learned pattern: '{pattern}'")
             
@@ -447,25 +3613,7 @@ class AdvancedDFAChatbot:
                 break
         
         if self.settings['auto_save']:
-            self.save_custom_patterns()
-    
-    def generate_dfa(self, pattern):
-        """Generate DFA states for a given pattern"""
-        states = {}
-        current_state = "q0"
-        
-        states[current_state] = {}
-        
-        for i, char in enumerate(pattern):
-            next_state = f"q{i + 1}"
-            states[current_state][char] = next_state
-            states[next_state] = {}
-            current_state = next_state
-        
-        return {
-            'states': states,
-            'accept_state': current_state
-        }
+            self.engine.save_custom_patterns()
     
     def visualize_dfa(self, pattern):
         """ASCII visualization of DFA structure"""
@@ -474,14 +3622,17 @@ class AdvancedDFAChatbot:
             return
         
         data = self.dfas[pattern]
-        dfa = data['dfa']
-        accept_state = data['accept']
+        dfa, accept_state = self.engine.get_pattern_dfa(pattern)
         
         print(f"\n🔄 DFA Structure for '{pattern}':")
         print("-" * 50)
         print(f"📊 States: {len(dfa)}")
-        print(f"🎯 Accept State: {accept_state}")
+        print(f"🎯 Accept State: {', '.join(accept_state) if isinstance(accept_state, list) else accept_state}")
         print(f"📈 Category: {data.get('category', 'unknown')}")
+        union = self.engine.union_dfa
+        print(f"🧬 Union DFA: {union.states_after + union.overlay_states} states "
+              f"({union.states_after} compiled from {union.states_before} before minimization, "
+              f"{union.overlay_states} in the learned overlay; shared by {len(self.dfas)} patterns)")
         print("\n🔗 Transitions:")
         
         for state, transitions in dfa.items():
@@ -489,7 +3640,7 @@ class AdvancedDFAChatbot:
                 for char, next_state in transitions.items():
                     print(f"   {state} --['{char}']--> {next_state}")
             else:
-                marker = " (ACCEPT)" if state == accept_state else " (DEAD)"
+                marker = " (ACCEPT)" if is_accept_state(state, accept_state) else " (DEAD)"
                 print(f"   {state}{marker}")
         print("-" * 50)
     
@@ -508,24 +3659,91 @@ class AdvancedDFAChatbot:
         print(f"🕒 Session Duration: {datetime.now() - self.stats['session_start']}")
         print(f"🎯 Total Patterns: {len(self.dfas)}")
         
+        lookups = self.stats['cache_hits'] + self.stats['cache_misses']
+        hit_rate = (self.stats['cache_hits'] / lookups * 100) if lookups > 0 else 0
+        print(f"⚡ Match Cache: {self.stats['cache_hits']} hits / {self.stats['cache_misses']} misses "
+              f"({hit_rate:.1f}% hit rate, {len(self.engine.match_cache)} entries)")
+        
+        union = self.engine.union_dfa
+        saved = (1 - union.states_after / union.states_before) * 100 if union.states_before else 0
+        print(f"🧬 Union DFA: {union.states_before} states -> {union.states_after} after minimization "
+              f"({saved:.1f}% smaller, {union.overlay_size} learned in overlay)")
+        
+        reloads = self.engine.reload_stats
+        if self.engine.watcher is not None or reloads['reloads'] or reloads['failures']:
+            print(f"🔄 Hot Reload: {reloads['reloads']} reloads, {reloads['failures']} failures, "
+                  f"last took {reloads['last_duration']:.2f}s")
+            if reloads['last_error']:
+                print(f"   ⚠️  Last error: {reloads['last_error']}")
+        
+        metrics = self.engine.metrics
+        if self.settings['metrics']:
+            as_us = lambda seconds: "> 1s" if seconds == math.inf else f"{seconds * 1e6:.1f}µs"
+            print("\n⏱️  Stage Latency (count, mean, p50 ≤, p99 ≤):")
+            for stage, count, mean, p50, p99 in metrics.summary():
+                print(f"   • {stage}: {count}, {as_us(mean)}, {as_us(p50)}, {as_us(p99)}")
+            messages = sum(metrics.tried)
+            if messages:
+                print(f"🔎 Patterns tried: {metrics.tried_sum / messages:.1f} per message "
+                      f"({', '.join(f'{k}: {v}' for k, v in metrics.outcomes.items())})")
+        else:
+            print("⏱️  Stage metrics are off (turn on 'metrics' in settings)")
+        
         if self.stats['pattern_usage']:
-            print(f"\n🔥 Most Popular Patterns:")
+            print("\n🔥 Most Popular Patterns:")
             sorted_patterns = sorted(self.stats['pattern_usage'].items(), 
                                    key=lambda x: x[1], reverse=True)[:5]
             for i, (pattern, count) in enumerate(sorted_patterns, 1):
                 print(f"   {i}. '{pattern}': {count} times")
         
-        # Category analysis
-        categories = defaultdict(int)
-        for data in self.dfas.values():
-            categories[data.get('category', 'unknown')] += 1
+        analytics = self.engine.analytics
+        if self.settings['analytics'] and analytics is not None and analytics.messages:
+            print(f"\n📡 Traffic ({analytics.messages} messages, ~{analytics.distinct.count()} distinct, "
+                  f"~{analytics.distinct_unmatched.count()} distinct unmatched):")
+            for seconds, hits, misses in analytics.hit_rates():
+                if hits + misses:
+                    print(f"   • last {seconds // 60} min: {hits} hits / {misses} misses "
+                          f"({hits / (hits + misses) * 100:.1f}% hit rate)")
+            unmatched = analytics.unmatched.top(3)
+            if unmatched:
+                print(f"   • Top unmatched: {', '.join(f'{item!r} ×{count}' for item, count, _ in unmatched)}")
         
-        print(f"\n📂 Pattern Categories:")
-        for category, count in categories.items():
-            print(f"   • {category}: {count} patterns")
+        # Category counts are kept per snapshot layer, so this never rescans the patterns
+        hits = analytics.category_hits if analytics is not None else Counter()
+        print("\n📂 Pattern Categories:")
+        for category, count in self.engine.pattern_snapshot.category_counts().items():
+            print(f"   • {category}: {count} patterns" + (f", {hits[category]} hits" if hits[category] else ""))
         
         print("=" * 50)
     
+    def show_unmatched(self):
+        """Most frequent inputs nothing matched, as candidates for 'learn'"""
+        analytics = self.engine.analytics
+        top = analytics.unmatched.top() if analytics is not None else []
+        if not top:
+            print("🎯 No unmatched inputs recorded yet")
+            return
+        print(f"\n❓ TOP UNMATCHED INPUTS (approximate, top {analytics.top_k} tracked)")
+        print("-" * 50)
+        for i, (item, count, error) in enumerate(top, 1):
+            print(f"   {i}. '{item}': {count} times" if not error else f"   {i}. '{item}': {count - error}-{count} times")
+        print("💡 Use 'learn' to teach the bot any of these")
+    
+    def export_metrics(self):
+        """Write the stage metrics as Prometheus text and JSON, plus the traffic analytics"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        try:
+            for path in (f"dfa_metrics_{timestamp}.prom", f"dfa_metrics_{timestamp}.json"):
+                self.engine.metrics.export(path)
+                print(f"📈 Metrics exported to {path}")
+            if self.engine.analytics is not None:
+                path = f"dfa_analytics_{timestamp}.json"
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(self.engine.analytics.snapshot(), f, indent=2, ensure_ascii=False)
+                print(f"📡 Traffic analytics exported to {path}")
+        except OSError as e:
+            print(f"❌ Metrics export failed: {e}")
+    
     def list_patterns(self):
         """Display all available patterns organized by category"""
         print("\n📋 AVAILABLE PATTERNS")
@@ -542,7 +3760,7 @@ class AdvancedDFAChatbot:
             print("-" * 30)
             
             for pattern, data in sorted(patterns):
-                states_count = len(data['dfa'])
+                states_count = len(self.engine.get_pattern_dfa(pattern)[0])
                 usage = self.stats['pattern_usage'].get(pattern, 0)
                 learned = "🎓" if data.get('learned') else ""
                 
@@ -551,56 +3769,96 @@ class AdvancedDFAChatbot:
                 print(f"     States: {states_count} | Usage: {usage}x")
                 print()
     
-    def export_conversation(self):
-        """Export conversation data to files"""
+    def export_conversation(self, background=None):
+        """Stream the chat history and patterns to (optionally compressed) export files"""
+        settings = self.settings
+        background = settings['background_export'] if background is None else background
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        jsonl = settings['export_format'] == 'jsonl'
+        compression = settings['export_compression']
         
-        # Export chat history
-        chat_filename = f"chat_history_{timestamp}.txt"
-        with open(chat_filename, 'w', encoding='utf-8') as f:
-            f.write("DFA CHATBOT CONVERSATION LOG\n")
-            f.write("=" * 50 + "\n\n")
-            
-            for entry in self.stats['conversation_history']:
-                f.write(f"{entry['timestamp']} - {entry['sender']}: {entry['message']}\n")
-                if 'trace' in entry and entry['trace']:
-                    f.write(f"   DFA Trace: {' → '.join(entry['trace'])}\n")
-                f.write("\n")
-            
-            f.write("\nSTATISTICS:\n")
-            f.write(f"Total Messages: {self.stats['total_messages']}\n")
-            f.write(f"Matched Messages: {self.stats['matched_messages']}\n")
-            success_rate = (self.stats['matched_messages'] / self.stats['total_messages'] * 100) if self.stats['total_messages'] > 0 else 0
-            f.write(f"Success Rate: {success_rate:.1f}%\n")
+        # Everything the writer needs is captured now, so the session can keep chatting
+        history = self.stats['conversation_history'].frozen()
+        totals = (self.stats['total_messages'], self.stats['matched_messages'])
+        dfas = self.engine.pattern_snapshot.dfas
+        compact = settings['export_patterns'] == 'compact'
         
-        # Export DFA patterns
-        patterns_filename = f"dfa_patterns_{timestamp}.json"
-        with open(patterns_filename, 'w', encoding='utf-8') as f:
-            json.dump(self.dfas, f, indent=2, ensure_ascii=False, default=str)
+        def write():
+            try:
+                chat_name = f"chat_history_{timestamp}_export.jsonl" if jsonl else f"chat_history_{timestamp}.txt"
+                with ExportFile(chat_name, compression) as chat_file:
+                    chat_file.write_lines(self.history_lines(history, totals, jsonl))
+                with ExportFile(f"dfa_patterns_{timestamp}.{'jsonl' if jsonl else 'json'}", compression) as patterns_file:
+                    patterns_file.write_lines(self.pattern_lines(dfas, jsonl, compact))
+            except (OSError, ValueError) as e:
+                print(f"❌ Export failed: {e}")
+                return
+            print("✅ Exported:")
+            print(f"   📄 Chat History: {chat_file.path}")
+            print(f"   🔧 DFA Patterns: {patterns_file.path}")
+            if chat_file.compression != compression:
+                print(f"   ℹ️  zstandard is not installed, so {chat_file.compression} was used instead")
         
-        print(f"✅ Exported:")
-        print(f"   📄 Chat History: {chat_filename}")
-        print(f"   🔧 DFA Patterns: {patterns_filename}")
+        if not background:
+            write()
+            return
+        thread = threading.Thread(target=write, name=f"export-{timestamp}")
+        self.export_threads = [t for t in self.export_threads if t.is_alive()] + [thread]
+        thread.start()
+        print("📤 Exporting in the background...")
     
-    def save_custom_patterns(self):
-        """Save user-learned patterns"""
-        custom_patterns = {k: v for k, v in self.dfas.items() if v.get('learned')}
+    def finish_exports(self):
+        """Wait for background exports so quitting never leaves a truncated file"""
+        for thread in self.export_threads:
+            thread.join()
+        self.export_threads = []
+    
+    def history_lines(self, history, totals, jsonl=False):
+        """Export lines for the chat history: the text log, or one JSON entry per line"""
+        def expanded(entry):
+            # Compact traces are stored as state ids; expand them while the pattern still exists
+            if entry.get('trace') and 'trace_pattern' in entry and entry['trace_pattern'] in self.engine.dfas:
+                trace = self.engine.format_trace_states(entry['trace_pattern'], entry['trace'])
+                entry = {k: v for k, v in entry.items() if k != 'trace_pattern'}
+                entry['trace'] = trace
+            return entry
         
-        if custom_patterns:
-            with open('custom_patterns.json', 'w', encoding='utf-8') as f:
-                json.dump(custom_patterns, f, indent=2, ensure_ascii=False, default=str)
-            print(f"💾 Saved {len(custom_patterns)} custom patterns")
+        if jsonl:
+            for entry in history:
+                yield json.dumps(expanded(entry), ensure_ascii=False, default=list) + "\n"
+            return
+        
+        yield "DFA CHATBOT CONVERSATION LOG\n"
+        yield "=" * 50 + "\n\n"
+        for entry in history:
+            entry = expanded(entry)
+            timestamp = datetime.fromtimestamp(entry['timestamp']).strftime("%Y-%m-%d %H:%M:%S")
+            yield f"{timestamp} - {entry['sender']}: {entry['message']}\n"
+            if entry.get('trace'):
+                yield f"   DFA Trace: {' → '.join(map(str, entry['trace']))}\n"
+            yield "\n"
+        
+        total, matched = totals
+        success_rate = (matched / total * 100) if total > 0 else 0
+        yield "\nSTATISTICS:\n"
+        yield f"Total Messages: {total}\n"
+        yield f"Matched Messages: {matched}\n"
+        yield f"Success Rate: {success_rate:.1f}%\n"
     
-    def load_custom_patterns(self):
-        """Load previously saved custom patterns"""
-        try:
-            if os.path.exists('custom_patterns.json'):
-                with open('custom_patterns.json', 'r', encoding='utf-8') as f:
-                    custom_patterns = json.load(f)
-                    self.dfas.update(custom_patterns)
-                print(f"📂 Loaded {len(custom_patterns)} custom patterns")
-        except Exception as e:
-            print(f"⚠️  Could not load custom patterns: {e}")
+    def pattern_lines(self, dfas, jsonl=False, compact=False):
+        """Export lines for the patterns: one JSON object per line, or one entry per line of a JSON object"""
+        export = self.engine.export_pattern
+        if jsonl:
+            for pattern, data in dfas.items():
+                yield json.dumps({"pattern": pattern, **export(pattern, data, compact)},
+                                 ensure_ascii=False, default=str) + "\n"
+            return
+        separator = "{\n"
+        for pattern, data in dfas.items():
+            yield (f"{separator}  {json.dumps(pattern, ensure_ascii=False)}: "
+                   f"{json.dumps(export(pattern, data, compact), ensure_ascii=False, default=str)}")
+            separator = ",\n"
+        yield "{}\n" if separator == "{\n" else "\n}\n"
     
     def handle_command(self, user_input):
         """Handle special commands"""
@@ -624,6 +3882,12 @@ class AdvancedDFAChatbot:
         elif command == 'settings':
             self.modify_settings()
             return True
+        elif command == 'metrics':
+            self.export_metrics()
+            return True
+        elif command == 'unmatched':
+            self.show_unmatched()
+            return True
         elif command == 'clear':
             self.stats['conversation_history'].clear()
             print("🗑️  Conversation history cleared!")
@@ -632,9 +3896,22 @@ class AdvancedDFAChatbot:
             pattern = command[10:]
             self.visualize_dfa(pattern)
             return True
+        elif command.startswith('import '):
+            # File names keep their case
+            self.import_patterns_file(user_input.strip()[7:].strip())
+            return True
         
         return False
     
+    def import_patterns_file(self, path):
+        """Bulk import patterns and print the import report"""
+        try:
+            report = self.engine.import_patterns(path)
+        except (OSError, ValueError) as e:
+            print(f"❌ Import failed: {e}")
+            return
+        print_import_report(report)
+    
     def modify_settings(self):
         """Interactive settings modification"""
         print("\n⚙️  SETTINGS")
@@ -659,6 +3936,13 @@ class AdvancedDFAChatbot:
             except ValueError:
                 self.settings[setting] = new_value
         
+        if setting == 'history_size':
+            self.stats['conversation_history'].resize(int(self.settings['history_size']))
+        elif setting in ('history_spill', 'history_gzip'):
+            # Exports still streaming the old spill file finish before it is replaced
+            self.finish_exports()
+            self.stats['conversation_history'] = self.new_history(self.stats['conversation_history'])
+        
         print(f"✅ Updated {setting} to {self.settings[setting]}")
     
     def run(self):
@@ -680,19 +3964,18 @@ class AdvancedDFAChatbot:
                     print(f"🤖 Bot: {random.choice(farewell_responses)}")
                     
                     if self.settings['auto_save']:
-                        self.save_custom_patterns()
+                        self.engine.save_custom_patterns()
+                    self.engine.stop_watching()
+                    self.finish_exports()
+                    self.stats['conversation_history'].close()
                     break
                 
                 # Handle special commands
                 if self.handle_command(user_input):
                     continue
                 
-                # Update statistics
-                self.stats['total_messages'] += 1
-                
-                # Find best match and generate response
-                match_result = self.find_best_match(user_input)
-                response, trace = self.generate_response(match_result, user_input)
+                # Match, respond and record through the engine
+                response, trace = self.engine.respond(user_input)
                 
                 # Add response delay for more natural feel
                 if self.settings['response_delay'] > 0:
@@ -705,32 +3988,234 @@ class AdvancedDFAChatbot:
                 if self.settings['show_traces'] and trace:
                     print(f"🔍 DFA Trace: {' → '.join(trace)}")
                 
-                # Record conversation
-                self.stats['conversation_history'].append({
-                    'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    'sender': 'User',
-                    'message': user_input
-                })
-                self.stats['conversation_history'].append({
-                    'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    'sender': 'Bot',
-                    'message': response,
-                    'trace': trace if self.settings['show_traces'] else []
-                })
-                
             except KeyboardInterrupt:
-                print(f"\n🤖 Bot: Goodbye! Thanks for the conversation! 👋")
+                print("\n🤖 Bot: Goodbye! Thanks for the conversation! 👋")
                 if self.settings['auto_save']:
-                    self.save_custom_patterns()
+                    self.engine.save_custom_patterns()
+                self.engine.stop_watching()
+                self.finish_exports()
+                self.stats['conversation_history'].close()
                 break
             except Exception as e:
                 print(f"❌ Error: {e}")
                 print("Please try again or type 'help' for commands.")
 
+class ChatSession:
+    """Per-user stats, settings and match cache over a shared DFAChatEngine; one per thread or connection"""
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self.settings = dict(engine.settings)
+        self.stats = {
+            'total_messages': 0,
+            'matched_messages': 0,
+            'pattern_usage': PatternUsage(),
+            'session_start': datetime.now(),
+            'cache_hits': 0,
+            'cache_misses': 0
+        }
+        self.match_cache = LRUCache(int(self.settings['match_cache_size']))
+    
+    def respond(self, message, with_match=False):
+        """Match and answer one message; returns (response, trace), plus the match result if with_match"""
+        self.stats['total_messages'] += 1
+        match_result = self.engine.find_best_match(message, self.stats, self.settings, self.match_cache)
+        response, trace = self.engine.generate_response(match_result, message, self.stats, self.settings)
+        if with_match:
+            return response, trace, match_result
+        return response, trace
+    
+    def learn(self, pattern, response, category="custom", priority=3, save=None):
+        """Teach the shared engine a pattern; other sessions see it on their next message"""
+        return self.engine.learn(pattern, response, category, priority, save)
+    
+    def summary(self):
+        """One-line statistics for this session"""
+        total = self.stats['total_messages']
+        matched = self.stats['matched_messages']
+        success_rate = (matched / total * 100) if total > 0 else 0
+        return f"📊 {total} messages, {matched} matched ({success_rate:.1f}%)"
+
+class ChatServer:
+    """Asyncio line-based TCP chat server; every connection gets its own ChatSession"""
+    
+    def __init__(self, engine, host='127.0.0.1', port=8765):
+        self.engine = engine
+        self.host = host
+        self.port = port
+        self.active_sessions = 0
+        self.total_sessions = 0
+    
+    async def handle_connection(self, reader, writer):
+        import asyncio
+        session = ChatSession(self.engine)
+        self.active_sessions += 1
+        self.total_sessions += 1
+        try:
+            await self.send(writer, "🤖 Bot: Connected to DFA-Bot! Type 'exit' to leave.")
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = line.decode('utf-8').strip()
+                except UnicodeDecodeError as e:
+                    # One bad line shouldn't cost the client its session
+                    self.engine.notify(f"⚠️  Undecodable message from a client: {e}")
+                    await self.send(writer, "🤖 Bot: Sorry, I could only read UTF-8 text.")
+                    continue
+                if message == "":
+                    continue
+                
+                command = message.lower()
+                if command in ["exit", "quit", "bye", "end"]:
+                    await self.send(writer, "🤖 Bot: Goodbye! Thanks for chatting! 👋")
+                    break
+                if command == 'stats':
+                    await self.send(writer, session.summary())
+                    continue
+                
+                try:
+                    response, trace = session.respond(message)
+                except Exception as e:
+                    self.engine.notify(f"❌ Error answering {message!r}: {e!r}")
+                    await self.send(writer, "🤖 Bot: Sorry, something went wrong with that message.")
+                    continue
+                
+                # Only this session waits; other connections keep being served
+                if session.settings['response_delay'] > 0:
+                    await asyncio.sleep(session.settings['response_delay'])
+                
+                reply = f"🤖 Bot: {response}"
+                if session.settings['show_traces'] and trace:
+                    reply += f"\n🔍 DFA Trace: {' → '.join(trace)}"
+                await self.send(writer, reply)
+        except ConnectionError:
+            pass
+        finally:
+            self.active_sessions -= 1
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+    
+    async def send(self, writer, text):
+        writer.write((text + "\n").encode('utf-8'))
+        await writer.drain()
+    
+    async def serve_forever(self):
+        import asyncio
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port, backlog=4096)
+        print(f"🌐 Serving DFA chat on {self.host}:{self.port} (Ctrl+C to stop)")
+        async with server:
+            await server.serve_forever()
+
+_batch_engine = None
+
+def _init_batch_worker(engine):
+    """Process-pool initializer: keep the shared pattern set for this worker"""
+    global _batch_engine
+    _batch_engine = engine
+
+def _classify_chunk(messages):
+    return _batch_engine.classify_batch(messages)
+
+def classify_file(input_path, output_path=None, workers=1, chunksize=256, pattern_files=(), **engine_options):
+    """Stream messages from a file (or '-' for stdin) and write JSONL results in order"""
+    # Loading notices go to stderr so they never mix with the JSONL stream
+    engine = DFAChatEngine(notify=lambda message: print(message, file=sys.stderr), pattern_files=pattern_files,
+                           **engine_options)
+    
+    source = sys.stdin if input_path == '-' else open(input_path, 'r', encoding='utf-8')
+    target = open(output_path, 'w', encoding='utf-8') if output_path else sys.stdout
+    try:
+        messages = (line.rstrip('\r\n') for line in source)
+        for result in engine.classify_many(messages, workers, chunksize):
+            target.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+def print_import_report(report):
+    """Human-readable summary of DFAChatEngine.import_patterns()"""
+    print(f"📥 {report['source']}: {report['rows']} rows in {report['seconds']:.2f}s "
+          f"({report['rows_per_second']:.0f} rows/s)")
+    print(f"   • Imported: {report['imported']} new patterns ({report['merged']} rows merged into earlier phrases)")
+    print(f"   • Duplicates skipped: {report['duplicates']}")
+    print(f"   • Rejected: {report['rejected']}")
+    for number, reason in report['rejected_rows']:
+        print(f"     - line {number}: {reason}")
+    if report['rejected'] > len(report['rejected_rows']):
+        print(f"     - ... {report['rejected'] - len(report['rejected_rows'])} more")
+    if 'compile_seconds' in report:
+        print(f"   • Read {report['read_seconds']:.2f}s, compile {report['compile_seconds']:.2f}s, "
+              f"save {report.get('save_seconds', 0.0):.2f}s")
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Advanced DFA Chatbot")
+    parser.add_argument('--classify', metavar='FILE',
+                        help="classify one message per line from FILE ('-' for stdin) and write JSONL")
+    parser.add_argument('--output', metavar='FILE', help="JSONL output file (default: stdout)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="worker processes for --classify")
+    parser.add_argument('--chunksize', type=int, default=256,
+                        help="messages sent to a worker at a time")
+    parser.add_argument('--compile-patterns', action='store_true',
+                        help="compile all patterns into the binary pattern store and exit")
+    parser.add_argument('--patterns', metavar='FILE', action='append', default=[],
+                        help="extra JSON pattern file to load (repeatable)")
+    parser.add_argument('--import', dest='import_files', metavar='FILE', action='append', default=[],
+                        help="bulk import patterns from a CSV or JSONL file and exit (repeatable)")
+    parser.add_argument('--hot-reload', action='store_true',
+                        help="watch the pattern files and reload them when they change")
+    parser.add_argument('--serve', action='store_true', help="run the asyncio TCP chat server")
+    parser.add_argument('--host', default='127.0.0.1', help="server bind address")
+    parser.add_argument('--port', type=int, default=8765, help="server port")
+    return parser.parse_args(argv)
+
 def main():
     """Main function to run the chatbot"""
+    args = parse_args()
+    # Library engines write no files of their own; the command line keeps these next to the custom patterns
+    paths = {'store_path': 'patterns.dfab', 'regex_cache_path': 'regex_cache.json'}
+    engine_options = {'pattern_files': args.patterns, **paths}
+    if args.hot_reload:
+        engine_options['settings'] = {'hot_reload': True}
+    if args.classify:
+        classify_file(args.classify, args.output, args.workers, args.chunksize, args.patterns, **paths)
+        return
+    
+    if args.import_files:
+        engine = DFAChatEngine(notify=print, pattern_files=args.patterns, **paths)
+        for path in args.import_files:
+            try:
+                print_import_report(engine.import_patterns(path))
+            except (OSError, ValueError) as e:
+                print(f"❌ Import of {path} failed: {e}")
+        engine.save_custom_patterns()
+        return
+    
+    if args.compile_patterns:
+        engine = DFAChatEngine(notify=print, pattern_files=args.patterns, **paths)
+        engine.ensure_loaded()
+        engine.compile_pattern_store(engine.store_path, engine.store_source_hash)
+        print(f"🧱 Compiled {len(engine.dfas)} patterns into {engine.store_path}")
+        return
+    
+    if args.serve:
+        import asyncio
+        engine = DFAChatEngine(notify=print, **engine_options)
+        engine.ensure_loaded()
+        try:
+            asyncio.run(ChatServer(engine, args.host, args.port).serve_forever())
+        except KeyboardInterrupt:
+            print("\n🛑 Server stopped")
+        return
+    
     try:
-        chatbot = AdvancedDFAChatbot()
+        chatbot = AdvancedDFAChatbot(**engine_options)
         chatbot.run()
     except Exception as e:
         print(f"❌ Failed to start chatbot: {e}")
@@ -0,0 +1,374 @@
+"""Reproducible performance benchmarks for the DFA chatbot engine"""
+import json
+import os
+import sys
+import time
+import random
+import platform
+import tempfile
+import threading
+import tracemalloc
+from datetime import datetime
+
+from Advanced_DFA_ChatBot import BatchFuzzyScorer, ChatSession, DFAChatEngine, PatternJournal, PatternUsage
+
+try:
+    import resource
+except ImportError:   # not available on Windows
+    resource = None
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "ta", "vo", "shi", "an", "el", "or", "ix",
+             "pe", "da", "gu", "zo", "ba", "fi", "ho", "qu", "we", "ny", "sa", "tu"]
+
+LEARN_INTERVAL = 0.005   # seconds between patterns learned by the stress-test writer
+
+def make_vocabulary(rng, size=4096):
+    """Deterministic list of distinct pseudo-words"""
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+def make_patterns(count, rng):
+    """Synthetic custom pattern set of `count` unique phrases in the snapshot format"""
+    vocabulary = make_vocabulary(rng)
+    categories = ["greeting", "question", "smalltalk", "support", "custom"]
+    patterns = {}
+    while len(patterns) < count:
+        phrase = " ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 5)))
+        if phrase not in patterns:
+            patterns[phrase] = {
+                "responses": [f"response {len(patterns)}"],
+                "category": rng.choice(categories),
+                "priority": rng.randint(1, 3),
+                "learned": True
+            }
+    return patterns
+
+def make_typo(text, rng):
+    """One random edit: substitution, deletion, insertion or transposition"""
+    if len(text) < 2:
+        return text + rng.choice("abcdefghijklmnopqrstuvwxyz")
+    i = rng.randrange(len(text) - 1)
+    letter = rng.choice("abcdefghijklmnopqrstuvwxyz")
+    edit = rng.randrange(4)
+    if edit == 0:
+        return text[:i] + letter + text[i + 1:]
+    if edit == 1:
+        return text[:i] + text[i + 1:]
+    if edit == 2:
+        return text[:i] + letter + text[i:]
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+def make_traffic(phrases, count, rng, mix=(0.6, 0.25, 0.15)):
+    """Messages drawn from exact hits, single-edit typos and misses in the given ratio"""
+    exact, typo, _ = mix
+    traffic = []
+    for _ in range(count):
+        roll = rng.random()
+        phrase = rng.choice(phrases)
+        if roll < exact:
+            traffic.append(phrase)
+        elif roll < exact + typo:
+            traffic.append(make_typo(phrase, rng))
+        else:
+            traffic.append(" ".join(rng.choice(["zzq", "xylo", "plimb", "quorv", "brint"])
+                                    for _ in range(rng.randint(1, 4))))
+    return traffic
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def peak_rss_kb():
+    """Process-wide resident set high-water mark, where the platform reports it"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+def measure(size, operation, func, inputs, budget):
+    """Time func(item) for each input until the inputs or the time budget run out"""
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+    latencies = []
+    clock = time.perf_counter
+    started = clock()
+    deadline = started + budget
+    for item in inputs:
+        begin = clock()
+        func(item)
+        end = clock()
+        latencies.append(end - begin)
+        if end > deadline:
+            break
+    elapsed = clock() - started
+
+    latencies.sort()
+    result = {
+        'size': size,
+        'operation': operation,
+        'count': len(latencies),
+        'seconds': round(elapsed, 6),
+        'ops_per_sec': round(len(latencies) / elapsed, 2) if elapsed > 0 else None,
+        'p50_us': round(percentile(latencies, 0.50) * 1e6, 2),
+        'p99_us': round(percentile(latencies, 0.99) * 1e6, 2),
+        'max_us': round(latencies[-1] * 1e6, 2) if latencies else 0.0,
+        'peak_rss_kb': peak_rss_kb()
+    }
+    if tracemalloc.is_tracing():
+        result['heap_peak_kb'] = tracemalloc.get_traced_memory()[1] // 1024
+    return result
+
+def run_size(size, args, report):
+    """Benchmark every operation against one synthetic pattern set"""
+    rng = random.Random(args.seed * 1_000_003 + size)
+    random.seed(args.seed)   # responses are picked with the module-level RNG
+
+    patterns = make_patterns(size, rng)
+    phrases = list(patterns)
+    traffic = make_traffic(phrases, args.queries, rng)
+    warmup = make_traffic(phrases, args.warmup, rng)
+    new_phrases = [phrase for phrase in make_patterns(args.queries, rng) if phrase not in patterns]
+
+    with tempfile.TemporaryDirectory(prefix="dfa_bench_") as workdir:
+        paths = {
+            'snapshot_path': os.path.join(workdir, "custom_patterns.json"),
+            'journal_path': os.path.join(workdir, "custom_patterns.journal"),
+            'store_path': os.path.join(workdir, "patterns.dfab")
+        }
+        PatternJournal(paths['snapshot_path'], paths['journal_path']).compact(patterns)
+        settings = {'auto_save': False}
+
+        # Cold load parses JSON and compiles the store; warm load maps the store
+        for label in ('cold', 'warm'):
+            engine = DFAChatEngine(settings=settings, **paths)
+            result = measure(size, 'load_custom_patterns', lambda _: engine.ensure_loaded(), [None], float('inf'))
+            result['variant'] = label
+            report(result)
+
+        for message in warmup:
+            engine.find_best_match(message)
+
+        report(measure(size, 'find_best_match', engine.find_best_match, traffic, args.budget))
+
+        # Offline path: 256 messages per call, with their fuzzy lookups scored as one batch
+        chunks = [traffic[i:i + 256] for i in range(0, len(traffic), 256)]
+        result = measure(size, 'classify_batch', engine.classify_batch, chunks, args.budget)
+        result['variant'] = 'numpy' if BatchFuzzyScorer.numpy() is not None else 'python'
+        report(result)
+        report(measure(size, 'get_suggestions', engine.get_suggestions, traffic, args.budget))
+
+        # A long-running session has usage counts for most patterns, which reorder the suggestions
+        usage = PatternUsage()
+        for phrase in phrases:
+            usage[phrase] = rng.randint(1, 50)
+        result = measure(size, 'get_suggestions', lambda message: engine.get_suggestions(message, usage=usage),
+                         traffic, args.budget)
+        result['variant'] = 'used'
+        report(result)
+
+        # Type-ahead: one keystroke at a time, with three predictions after each
+        def stream_one(message):
+            matcher = engine.stream_matcher()
+            for ch in message:
+                matcher.feed(ch)
+                matcher.reachable(3)
+        report(measure(size, 'stream_feed', stream_one, traffic, args.budget))
+
+        match_results = [(engine.find_best_match(message), message) for message in traffic]
+        report(measure(size, 'generate_response', lambda item: engine.generate_response(*item),
+                       match_results, args.budget))
+
+        # Mirrors the auto_save path: each learned phrase is journaled right away
+        def save_one(phrase):
+            engine.learn(phrase, "benchmark response")
+            engine.save_custom_patterns()
+        report(measure(size, 'save_custom_patterns', save_one, new_phrases, args.budget))
+        engine.stats['conversation_history'].close()
+
+def run_threads(size, args, report):
+    """Concurrent sessions against one engine while a writer keeps learning patterns"""
+    rng = random.Random(args.seed * 1_000_003 + size)
+    random.seed(args.seed)
+
+    patterns = make_patterns(size, rng)
+    phrases = list(patterns)
+    traffic = make_traffic(phrases, args.queries, rng)
+    new_phrases = [phrase for phrase in make_patterns(args.queries, rng) if phrase not in patterns]
+    thread_counts = [int(count) for count in args.threads.split(",") if count.strip()]
+
+    with tempfile.TemporaryDirectory(prefix="dfa_bench_") as workdir:
+        paths = {
+            'snapshot_path': os.path.join(workdir, "custom_patterns.json"),
+            'journal_path': os.path.join(workdir, "custom_patterns.journal"),
+            'store_path': os.path.join(workdir, "patterns.dfab")
+        }
+        PatternJournal(paths['snapshot_path'], paths['journal_path']).compact(patterns)
+        engine = DFAChatEngine(settings={'auto_save': False}, **paths)
+        engine.ensure_loaded()
+        pending = iter(new_phrases)
+        baseline = None
+
+        for count in thread_counts:
+            sessions = [ChatSession(engine) for _ in range(count)]
+            latencies = [[] for _ in range(count)]
+            errors = []
+            learned = []
+            done = threading.Event()
+            start = threading.Barrier(count + 1)
+
+            def read(session, timings):
+                start.wait()
+                clock = time.perf_counter
+                try:
+                    for message in traffic:
+                        begin = clock()
+                        session.respond(message)
+                        timings.append(clock() - begin)
+                except Exception as e:
+                    errors.append(repr(e))
+
+            # The writer learns a phrase every few milliseconds, so readers race frequent publishes
+            def write():
+                for phrase in pending:
+                    if done.is_set():
+                        break
+                    try:
+                        if engine.learn(phrase, "stress response"):
+                            learned.append(phrase)
+                    except Exception as e:
+                        errors.append(repr(e))
+                    time.sleep(LEARN_INTERVAL)
+
+            readers = [threading.Thread(target=read, args=(session, timings))
+                       for session, timings in zip(sessions, latencies)]
+            writer = threading.Thread(target=write)
+            for thread in readers:
+                thread.start()
+            writer.start()
+            started = time.perf_counter()
+            start.wait()
+            for thread in readers:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            done.set()
+            writer.join()
+
+            # Every pattern the writer got back True for must be visible to a fresh match
+            lost = [phrase for phrase in learned
+                    if engine.match_input(phrase, suggest=False).get('pattern') != phrase]
+            timings = sorted(latency for per_thread in latencies for latency in per_thread)
+            ops_per_sec = len(timings) / elapsed if elapsed > 0 else 0.0
+            baseline = baseline or ops_per_sec
+            report({
+                'size': size,
+                'operation': 'concurrent_respond',
+                'variant': f"{count}t",
+                'threads': count,
+                'count': len(timings),
+                'seconds': round(elapsed, 6),
+                'ops_per_sec': round(ops_per_sec, 2),
+                'scaling': round(ops_per_sec / baseline, 2) if baseline else None,
+                'p50_us': round(percentile(timings, 0.50) * 1e6, 2),
+                'p99_us': round(percentile(timings, 0.99) * 1e6, 2),
+                'max_us': round(timings[-1] * 1e6, 2) if timings else 0.0,
+                'learned': len(learned),
+                'lost': len(lost),
+                'errors': errors[:10],
+                'peak_rss_kb': peak_rss_kb()
+            })
+        engine.stats['conversation_history'].close()
+
+def compare(results, baseline_path, tolerance):
+    """Regressions against a previous results file: p50 slower than (1 + tolerance)x"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    key = lambda result: (result['size'], result['operation'], result.get('variant'))
+    previous = {key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        old = previous.get(key(result))
+        if old and old['p50_us'] > 0 and result['p50_us'] > old['p50_us'] * (1 + tolerance):
+            regressions.append({**result, 'baseline_p50_us': old['p50_us'],
+                                'ratio': round(result['p50_us'] / old['p50_us'], 2)})
+    return regressions
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the DFA chatbot engine")
+    parser.add_argument('--sizes', default="10,100,1000,10000,100000,1000000",
+                        help="comma-separated pattern set sizes")
+    parser.add_argument('--queries', type=int, default=2000, help="messages per operation")
+    parser.add_argument('--warmup', type=int, default=200, help="untimed messages before timing")
+    parser.add_argument('--budget', type=float, default=10.0,
+                        help="seconds per operation before the remaining queries are skipped")
+    parser.add_argument('--seed', type=int, default=1234, help="RNG seed for patterns and traffic")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="also report the Python heap peak per operation (slower)")
+    parser.add_argument('--threads', metavar='COUNTS',
+                        help="comma-separated thread counts: run the concurrent session stress test "
+                             "instead of the single-threaded matrix")
+    parser.add_argument('--output', metavar='FILE', help="write the JSON results here (default: stdout)")
+    parser.add_argument('--compare', metavar='FILE', help="baseline results file to check for regressions")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed p50 slowdown against --compare before failing")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Run the benchmark matrix and emit machine-readable results"""
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    results = []
+    def report(result):
+        results.append(result)
+        print(f"⏱️  {result['size']:>8} {result['operation']:<22} {result.get('variant', ''):<5} "
+              f"{result['count']:>6} ops  {result['ops_per_sec'] or 0:>11.1f}/s  "
+              f"p50 {result['p50_us']:>10.1f}µs  p99 {result['p99_us']:>10.1f}µs", file=sys.stderr)
+
+    for size in sizes:
+        (run_threads if args.threads else run_size)(size, args, report)
+
+    document = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'sizes': sizes,
+            'queries': args.queries,
+            'budget': args.budget,
+            'tracemalloc': args.tracemalloc,
+            'threads': args.threads
+        },
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2)
+    else:
+        json.dump(document, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for regression in regressions:
+            print(f"🐢 Regression: {regression['operation']} @ {regression['size']} "
+                  f"p50 {regression['baseline_p50_us']}µs -> {regression['p50_us']}µs "
+                  f"({regression['ratio']}x)", file=sys.stderr)
+        if regressions:
+            return 1
+    # A stress run fails outright on any exception or learned pattern a reader could not see
+    if any(result.get('errors') or result.get('lost') for result in results):
+        print("💥 Concurrent stress test saw errors or lost patterns", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+"""Replay exported chat logs against the DFA chatbot engine for load and capacity testing"""
+import json
+import re
+import sys
+import time
+import platform
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+from Advanced_DFA_ChatBot import ChatSession, DFAChatEngine, ExportFile
+from benchmark import percentile, peak_rss_kb
+
+# "2024-05-01 12:00:00 - User: hello" as written by export_conversation's text log
+LOG_LINE = re.compile(r"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d - User: (.*)$")
+
+def read_messages(path):
+    """User messages from a chat_history_*.txt log or a JSONL history, in order"""
+    # JSONL covers the live spill (.jsonl/.jsonl.gz) and jsonl exports (optionally .gz/.zst)
+    if path.replace('.gz', '').replace('.zst', '').endswith('.jsonl'):
+        with ExportFile.open_text(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry.get('sender') == 'User' and isinstance(entry.get('message'), str):
+                    yield entry['message']
+        return
+    with ExportFile.open_text(path) as f:
+        for line in f:
+            match = LOG_LINE.match(line.rstrip('\r\n'))
+            if match:
+                yield match.group(1)
+
+def current_rss_kb():
+    """Resident set size right now (Linux), falling back to the high-water mark"""
+    try:
+        with open('/proc/self/status', 'r', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return peak_rss_kb()
+
+def replay(engine, messages, workers=1, rate=None, sample_interval=1.0, on_sample=None):
+    """Drive one ChatSession per worker thread through the messages; returns the run summary"""
+    sessions = [ChatSession(engine) for _ in range(workers)]
+    latencies = [[] for _ in range(workers)]
+    delays = [[] for _ in range(workers)]
+    match_types = [Counter() for _ in range(workers)]
+    errors = []
+    timeline = []
+    position = iter(range(len(messages)))
+    position_lock = threading.Lock()
+    start = threading.Barrier(workers + 1)
+    finished = threading.Event()
+    clock = time.perf_counter
+
+    def work(session, timings, lags, types):
+        start.wait()
+        while True:
+            with position_lock:
+                index = next(position, None)
+            if index is None:
+                return
+            message = messages[index]
+            if rate:
+                # Open loop: message i is due at i / rate, however slow earlier replies were
+                due = started + index / rate
+                wait = due - clock()
+                if wait > 0:
+                    time.sleep(wait)
+            begin = clock()
+            try:
+                match_result = session.respond(message, with_match=True)[2]
+                types[match_result['type']] += 1
+            except Exception as e:
+                errors.append(repr(e))
+            end = clock()
+            timings.append(end - begin)
+            if rate:
+                lags.append(end - due)
+
+    def memory_point():
+        point = {
+            'seconds': round(clock() - started, 3),
+            'messages': sum(len(timings) for timings in latencies),
+            'rss_kb': current_rss_kb()
+        }
+        if tracemalloc.is_tracing():
+            point['heap_kb'] = tracemalloc.get_traced_memory()[0] // 1024
+        return point
+
+    def sample():
+        # Memory growth over time; the first sample is the baseline before any traffic
+        while True:
+            point = memory_point()
+            timeline.append(point)
+            if on_sample is not None:
+                on_sample(point)
+            if finished.wait(sample_interval):
+                break
+
+    threads = [threading.Thread(target=work, args=args, daemon=True)
+               for args in zip(sessions, latencies, delays, match_types)]
+    for thread in threads:
+        thread.start()
+    started = clock()
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = clock() - started
+    finished.set()
+    sampler.join()
+    timeline.append(memory_point())
+
+    timings = sorted(latency for per_worker in latencies for latency in per_worker)
+    types = sum(match_types, Counter())
+    summary = {
+        'workers': workers,
+        'target_rate': rate,
+        'count': len(timings),
+        'seconds': round(elapsed, 6),
+        'ops_per_sec': round(len(timings) / elapsed, 2) if elapsed > 0 else None,
+        'p50_us': round(percentile(timings, 0.50) * 1e6, 2),
+        'p90_us': round(percentile(timings, 0.90) * 1e6, 2),
+        'p99_us': round(percentile(timings, 0.99) * 1e6, 2),
+        'p999_us': round(percentile(timings, 0.999) * 1e6, 2),
+        'max_us': round(timings[-1] * 1e6, 2) if timings else 0.0,
+        'match_types': {kind: {'count': count, 'share': round(count / len(timings), 4)}
+                        for kind, count in types.most_common()},
+        'rss_growth_kb': timeline[-1]['rss_kb'] - timeline[0]['rss_kb']
+                         if timeline[0]['rss_kb'] is not None else None,
+        'peak_rss_kb': peak_rss_kb(),
+        'errors': errors[:10],
+        'error_count': len(errors),
+        'timeline': timeline
+    }
+    if rate:
+        # Latency from when a message was due, so a backlog shows up instead of hiding in the pacing
+        lags = sorted(lag for per_worker in delays for lag in per_worker)
+        summary['due_p50_us'] = round(percentile(lags, 0.50) * 1e6, 2)
+        summary['due_p99_us'] = round(percentile(lags, 0.99) * 1e6, 2)
+        summary['achieved_rate'] = summary['ops_per_sec']
+    return summary
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Replay chat logs against the DFA chatbot engine")
+    parser.add_argument('logs', nargs='+', metavar='LOG',
+                        help="chat_history_*.txt logs or JSONL histories (.jsonl, .jsonl.gz, .jsonl.zst)")
+    parser.add_argument('--workers', default="1",
+                        help="comma-separated worker thread counts; each count is one replay run")
+    parser.add_argument('--rate', type=float,
+                        help="target messages per second across all workers (default: as fast as possible)")
+    parser.add_argument('--loops', type=int, default=1, help="replay the messages this many times")
+    parser.add_argument('--limit', type=int, help="stop after this many messages")
+    parser.add_argument('--patterns', metavar='FILE', action='append', default=[],
+                        help="extra JSON pattern file to load (repeatable)")
+    parser.add_argument('--sample-interval', type=float, default=1.0,
+                        help="seconds between memory samples")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="also sample the Python heap (slower)")
+    parser.add_argument('--output', metavar='FILE', help="write the JSON results here (default: stdout)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Load the logs, replay them once per worker count and emit machine-readable results"""
+    args = parse_args(argv)
+    messages = [message for path in args.logs for message in read_messages(path)]
+    if not messages:
+        print("❌ No user messages found in the given logs", file=sys.stderr)
+        return 1
+    messages = (messages * args.loops)[:args.limit]
+    worker_counts = [int(count) for count in args.workers.split(",") if count.strip()]
+    if args.tracemalloc:
+        tracemalloc.start()
+
+    # Loading notices go to stderr so they never mix with the JSON results
+    engine = DFAChatEngine(notify=lambda message: print(message, file=sys.stderr),
+                           pattern_files=args.patterns)
+    engine.ensure_loaded()
+    print(f"📼 Replaying {len(messages)} messages from {len(args.logs)} log(s) "
+          f"against {len(engine.dfas)} patterns", file=sys.stderr)
+
+    def progress(point):
+        print(f"   {point['seconds']:>8.1f}s {point['messages']:>9} msgs  rss {point['rss_kb']} KB"
+              + (f"  heap {point['heap_kb']} KB" if 'heap_kb' in point else ""), file=sys.stderr)
+
+    runs = []
+    for workers in worker_counts:
+        result = replay(engine, messages, workers, args.rate, args.sample_interval, progress)
+        runs.append(result)
+        types = ", ".join(f"{kind} {entry['share']:.1%}" for kind, entry in result['match_types'].items())
+        print(f"⏱️  {workers:>3} workers  {result['count']:>8} msgs  {result['ops_per_sec'] or 0:>11.1f}/s  "
+              f"p50 {result['p50_us']:.1f}µs  p99 {result['p99_us']:.1f}µs  "
+              f"rss +{result['rss_growth_kb']} KB  ({types})", file=sys.stderr)
+        if result['error_count']:
+            print(f"💥 {result['error_count']} errors, first: {result['errors'][0]}", file=sys.stderr)
+
+    document = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'logs': args.logs,
+            'messages': len(messages),
+            'patterns': len(engine.dfas),
+            'rate': args.rate,
+            'tracemalloc': args.tracemalloc
+        },
+        'runs': runs
+    }
+    engine.stats['conversation_history'].close()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2, ensure_ascii=False)
+    else:
+        json.dump(document, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    return 1 if any(run['error_count'] for run in runs) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())